@@ -0,0 +1,141 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from read_bpmn_tasks_v2 import COMPRESSED_SUFFIXES, DEFAULT_FLATTEN_BUDGET, TranslationOptions, bpmn_stem, translate_file
+
+BPMN_SUFFIXES = ('.bpmn',) + tuple('.bpmn' + s for s in COMPRESSED_SUFFIXES)
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_NO_INPUTS = 2
+EXIT_COLLISIONS = 3
+
+def collect_inputs(patterns):
+    # Directories are scanned (non-recursively) for diagrams, anything else is
+    # treated as a glob; the result is de-duplicated and sorted
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for name in os.listdir(pattern):
+                if name.endswith(BPMN_SUFFIXES):
+                    found.add(os.path.join(pattern, name))
+        else:
+            for path in glob.glob(pattern, recursive=True):
+                if os.path.isfile(path):
+                    found.add(path)
+    return sorted(found)
+
+def stem_collisions(files):
+    # {stem: [paths]} for inputs that would write to the same <out>/<stem>/
+    # folder, e.g. a/x.bpmn and b/x.bpmn, or x.bpmn and x.bpmn.gz
+    by_stem = {}
+    for file_path in files:
+        by_stem.setdefault(bpmn_stem(file_path), []).append(file_path)
+    return {stem: paths for stem, paths in by_stem.items() if len(paths) > 1}
+
+def run_one(file_path, output_dir, options=None):
+    # Runs inside a worker process; never raises so one bad diagram cannot
+    # take the rest of the batch down with it
+    started = time.perf_counter()
+    try:
+        result = translate_file(file_path, output_dir, options)
+        result.update(file=file_path, status="ok")
+    except Exception as exc:
+        result = {
+            "file": file_path,
+            "status": "failed",
+            "error": f"{type(exc).__name__}: {exc}",
+            "traceback": traceback.format_exc(),
+        }
+    result["seconds"] = round(time.perf_counter() - started, 6)
+    return result
+
+def run_batch(files, output_dir=None, workers=None, options=None):
+    collisions = stem_collisions(files)
+    if collisions:
+        raise ValueError(f"Inputs share an output folder: {', '.join(sorted(collisions))}")
+    results = []
+    if workers == 1:
+        for file_path in files:
+            results.append(run_one(file_path, output_dir, options))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_one, f, output_dir, options): f for f in files}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                # The worker process itself died (e.g. killed by the OOM killer)
+                results.append({
+                    "file": futures[future],
+                    "status": "failed",
+                    "error": f"{type(exc).__name__}: {exc}",
+                    "seconds": None,
+                })
+    results.sort(key=lambda r: r["file"])
+    return results
+
+def build_summary(results, wall_seconds):
+    ok = [r for r in results if r["status"] == "ok"]
+    return {
+        "total": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "wall_seconds": round(wall_seconds, 6),
+        "predicates": sum(r["predicates"] for r in ok),
+        "actions": sum(r["actions"] for r in ok),
+        "files": results,
+    }
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Translate BPMN diagrams to PDDL in parallel.")
+    arg_parser.add_argument("inputs", nargs="+", help="BPMN files, directories or glob patterns")
+    arg_parser.add_argument("-o", "--output-dir", default=None, help="where to create the per-diagram folders (default: current directory)")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    arg_parser.add_argument("--flatten", action="store_true", help="unroll merges first and write <name>/flattened instead")
+    arg_parser.add_argument("--flatten-budget", type=int, default=DEFAULT_FLATTEN_BUDGET, help="give up on a diagram once flattening adds this many elements")
+    arg_parser.add_argument("--summary", default=None, help="write the aggregate JSON summary to this file ('-' for stdout)")
+    args = arg_parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        arg_parser.error("--workers must be at least 1")
+
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("No BPMN diagrams matched the given inputs", file=sys.stderr)
+        return EXIT_NO_INPUTS
+    collisions = stem_collisions(files)
+    if collisions:
+        for stem, paths in sorted(collisions.items()):
+            print(f"{', '.join(paths)} would all be written to {stem}/", file=sys.stderr)
+        return EXIT_COLLISIONS
+
+    started = time.perf_counter()
+    options = TranslationOptions(flatten=args.flatten, flatten_budget=args.flatten_budget)
+    results = run_batch(files, args.output_dir, args.workers, options)
+    summary = build_summary(results, time.perf_counter() - started)
+
+    for r in results:
+        if r["status"] == "ok":
+            print(f"ok      {r['file']} ({r['actions']} actions, {r['predicates']} predicates, {r['seconds']:.3f}s)")
+        else:
+            print(f"FAILED  {r['file']}: {r['error']}", file=sys.stderr)
+    print(f"\n{summary['succeeded']}/{summary['total']} diagrams translated in {summary['wall_seconds']:.3f}s")
+
+    if args.summary == "-":
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    elif args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    return EXIT_OK if summary["failed"] == 0 else EXIT_FAILURES
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import argparse
+import re
+import sys
+from collections import deque
+
+from determinize import determinize
+from pddl_model import parse_domain, parse_problem
+from read_bpmn_tasks_v2 import BPMNParser, sanitize_name
+from state_explorer import CompiledDomain
+from token_simulator import net_from_parser, simulate
+
+# Differential conformance: random executions of the BPMN graph (from the
+# token simulator) are replayed through the reference domain and through a
+# candidate domain, e.g. an optimised or transformed one. A trace step for
+# element X is matched by a block of actions whose origin is X, possibly
+# interleaved with silent bookkeeping actions (those whose precondition
+# mentions no flow-node predicate, such as inclusive counters). Nondeterminism is kept
+# as a frontier of possible states, so a trace conforms if some resolution of
+# every oneof follows it.
+
+STUCK, GOAL, NO_GOAL, TOO_LARGE = "stuck", "goal", "no-goal", "frontier-limit"
+
+class ReplayDomain:
+    def __init__(self, domain_text, action_origins, flow_predicates, max_frontier=10000):
+        self.compiled = CompiledDomain(parse_domain(domain_text))
+        self.max_frontier = max_frontier
+        self.by_label = {}
+        self.silent = []
+        flow_bits = 0
+        for pred in flow_predicates:
+            if pred in self.compiled.bits:
+                flow_bits |= 1 << self.compiled.bits[pred]
+        for action in self.compiled.actions:
+            labels = origins_of(action.name, action_origins)
+            if not labels or not (action.pos | action.neg) & flow_bits:
+                self.silent.append(action)
+            else:
+                for label in labels:
+                    self.by_label.setdefault(label, []).append(action)
+        self.done = 1 << self.compiled.bits["done"]
+        self.block_cache = {}
+        self.closure_cache = {}
+
+    def block(self, state, label):
+        # States reached by one or more `label` actions, with silent actions
+        # allowed anywhere in between; cached per (state, label)
+        key = (state, label)
+        cached = self.block_cache.get(key)
+        if cached is not None:
+            return cached
+        labelled = self.by_label.get(label, [])
+        seen = {(state, False)}
+        queue = deque(seen)
+        result = set()
+        while queue:
+            s, fired = queue.popleft()
+            if fired:
+                result.add(s)
+            for actions, now_fired in ((labelled, True), (self.silent, fired)):
+                for action in actions:
+                    if action.applicable(s):
+                        for succ in action.successors(s):
+                            if (succ, now_fired) not in seen:
+                                seen.add((succ, now_fired))
+                                queue.append((succ, now_fired))
+        result = frozenset(result)
+        self.block_cache[key] = result
+        return result
+
+    def silent_closure(self, state):
+        cached = self.closure_cache.get(state)
+        if cached is None:
+            cached = {state}
+            queue = deque(cached)
+            while queue:
+                s = queue.popleft()
+                for action in self.silent:
+                    if action.applicable(s):
+                        for succ in action.successors(s):
+                            if succ not in cached:
+                                cached.add(succ)
+                                queue.append(succ)
+            cached = frozenset(cached)
+            self.closure_cache[state] = cached
+        return cached
+
+    def replay(self, init_atoms, trace, labels):
+        # (status, index of the failing trace step or len(trace))
+        frontier = {self.compiled.encode(init_atoms)}
+        for step, element in enumerate(trace):
+            if element not in labels:
+                continue
+            nxt = set()
+            for state in frontier:
+                nxt |= self.block(state, element)
+            if not nxt:
+                return STUCK, step
+            if len(nxt) > self.max_frontier:
+                return TOO_LARGE, step
+            frontier = nxt
+        reached = any(s & self.done for state in frontier for s in self.silent_closure(state))
+        return (GOAL if reached else NO_GOAL), len(trace)
+
+def origins_of(action_name, action_origins):
+    # Origin elements of an action (several for actions shared between
+    # elements, such as the start action); transformed copies such as the
+    # determinized <action>_o<i> inherit the origins of their source action
+    origins = action_origins.get(action_name)
+    if origins is None:
+        base = re.sub(r"_o\d+$", "", action_name)
+        origins = action_origins.get(base)
+    return set(origins or [])
+
+class TraceOutcome:
+    def __init__(self, trace, count, reference, candidate):
+        self.trace = trace
+        self.count = count
+        self.reference = reference      # (status, step)
+        self.candidate = candidate
+
+    @property
+    def agrees(self):
+        return self.reference == self.candidate
+
+class ConformanceReport:
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+
+    @property
+    def traces(self):
+        return sum(o.count for o in self.outcomes)
+
+    def mismatches(self):
+        return [o for o in self.outcomes if not o.agrees]
+
+    def unreplayable(self):
+        # Traces the reference domain itself cannot follow: agreement on
+        # those says nothing about the candidate
+        return [o for o in self.outcomes if o.reference[0] in (STUCK, TOO_LARGE)]
+
+    def status_counts(self, which):
+        counts = {}
+        for o in self.outcomes:
+            status = getattr(o, which)[0]
+            counts[status] = counts.get(status, 0) + o.count
+        return counts
+
+def check_conformance(parser, candidate_domain=None, candidate_origins=None, instances=10000, max_steps=200, seed=None, domain_name="bpmn-generated"):
+    # Replay simulated traces through the reference domain and a candidate
+    # (default: its all-outcomes determinization). Distinct traces are
+    # replayed once and weighted by how often they were simulated.
+    reference, predicates, origins = parser.generate_pddl_domain_with_origins(domain_name)
+    start_events = [e.id for e in parser.get_process_start_events()]
+    init = parse_problem(parser.generate_problem_texts(start_events, predicates, domain_name)["p0"]).init
+    if candidate_domain is None:
+        candidate_domain = determinize(parse_domain(reference)).to_pddl()
+    candidate_origins = candidate_origins or origins
+
+    net = net_from_parser(parser)
+    flow_predicates = {sanitize_name(n) for n in net.nodes}
+    reference_replay = ReplayDomain(reference, origins, flow_predicates)
+    candidate_replay = ReplayDomain(candidate_domain, candidate_origins, flow_predicates)
+    labels = set(reference_replay.by_label) | set(candidate_replay.by_label)
+
+    # p0 only sets the inclusive counters; predicates unknown to a domain
+    # (e.g. dropped by slicing) are left out of its initial state
+    ref_init = [a for a in init if a in reference_replay.compiled.bits]
+    cand_init = [a for a in init if a in candidate_replay.compiled.bits]
+
+    distribution = simulate(net, instances, max_steps, seed).trace_distribution()
+    outcomes = []
+    for trace, count in distribution.items():
+        outcomes.append(TraceOutcome(
+            trace, count,
+            reference_replay.replay(ref_init, trace, labels),
+            candidate_replay.replay(cand_init, trace, labels),
+        ))
+    return ConformanceReport(outcomes)
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Replay simulated BPMN executions through the reference domain and a candidate domain and report where they disagree.")
+    arg_parser.add_argument("file", help="BPMN diagram")
+    arg_parser.add_argument("--candidate", default=None, help="candidate domain PDDL (default: all-outcomes determinization of the reference)")
+    arg_parser.add_argument("-n", "--instances", type=int, default=10000)
+    arg_parser.add_argument("--max-steps", type=int, default=200)
+    arg_parser.add_argument("--seed", type=int, default=None)
+    arg_parser.add_argument("--show", type=int, default=3, help="number of mismatching traces to print")
+    args = arg_parser.parse_args(argv)
+
+    parser = BPMNParser(args.file)
+    parser.parse()
+    candidate = None
+    if args.candidate:
+        with open(args.candidate) as f:
+            candidate = f.read()
+    report = check_conformance(parser, candidate, None, args.instances, args.max_steps, args.seed)
+
+    mismatches = report.mismatches()
+    unreplayable = report.unreplayable()
+    print(f"{args.file}: {report.traces} traces ({len(report.outcomes)} distinct)")
+    print(f"  reference: {report.status_counts('reference')}")
+    print(f"  candidate: {report.status_counts('candidate')}")
+    print(f"  {sum(o.count for o in mismatches)} traces disagree ({len(mismatches)} distinct)")
+    for outcome in mismatches[:args.show]:
+        (ref_status, ref_step), (cand_status, cand_step) = outcome.reference, outcome.candidate
+        print(f"    reference {ref_status} at step {ref_step}, candidate {cand_status} at step {cand_step}: "
+              f"{' -> '.join(outcome.trace)}")
+    if unreplayable:
+        print(f"  WARNING: the reference domain cannot replay {sum(o.count for o in unreplayable)} traces "
+              f"({len(unreplayable)} distinct); the check is inconclusive for them")
+        for outcome in unreplayable[:args.show]:
+            status, step = outcome.reference
+            print(f"    reference {status} at step {step} ({outcome.trace[step]}): {' -> '.join(outcome.trace)}")
+    return 1 if mismatches or unreplayable else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import argparse
+import os
+import sys
+from collections import deque
+
+from pddl_model import Action, Domain, apply_effect, effect_outcomes, flatten_and, format_sexpr, holds, parse_domain, parse_problem, uses
+from read_bpmn_tasks_v2 import translate
+
+def determinize(domain):
+    # All-outcomes determinization: every oneof outcome (and every combination
+    # of independent oneofs) becomes its own deterministic action, named
+    # <action>_o<i>. Actions without oneof are kept as they are.
+    actions = []
+    for action in domain.actions:
+        outcomes = []
+        seen = set()
+        for outcome in effect_outcomes(action.effect):
+            outcome = flatten_and(outcome)
+            key = format_sexpr(outcome)
+            if key not in seen:
+                seen.add(key)
+                outcomes.append(outcome)
+        if len(outcomes) == 1:
+            actions.append(Action(action.name, action.precondition, outcomes[0]))
+            continue
+        for i, outcome in enumerate(outcomes):
+            actions.append(Action(f"{action.name}_o{i}", action.precondition, outcome))
+
+    requirements = list(domain.requirements)
+    extra = [":negative-preconditions"]
+    if any(uses(a.effect, "when") for a in actions):
+        extra.append(":conditional-effects")
+    for req in extra:
+        if req not in requirements:
+            requirements.append(req)
+    return Domain(domain.name, requirements, domain.types, domain.predicates, actions)
+
+def find_plan(domain, init, goal, max_states=None):
+    # Breadth-first search over a deterministic domain. Returns (plan or None,
+    # number of states expanded); plan is a list of action names.
+    start = frozenset(init)
+    parents = {start: None}
+    queue = deque([start])
+    while queue:
+        state = queue.popleft()
+        if holds(goal, state):
+            plan = []
+            while parents[state] is not None:
+                state, name = parents[state]
+                plan.append(name)
+            return plan[::-1], len(parents)
+        if max_states is not None and len(parents) >= max_states:
+            break
+        for action in domain.actions:
+            if holds(action.precondition, state):
+                successor = apply_effect(action.effect, state)
+                if successor not in parents:
+                    parents[successor] = (state, action.name)
+                    queue.append(successor)
+    return None, len(parents)
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Write all-outcomes determinized domains and check whether any path to (done) exists.")
+    arg_parser.add_argument("files", nargs="+", help="BPMN diagrams")
+    arg_parser.add_argument("-o", "--output-dir", default=None)
+    arg_parser.add_argument("--check", action="store_true", help="search each problem for a path to the goal")
+    arg_parser.add_argument("--max-states", type=int, default=None)
+    args = arg_parser.parse_args(argv)
+
+    exit_code = 0
+    for file_path in args.files:
+        result = translate(file_path)
+        det = determinize(parse_domain(result.domain))
+        _, problem_paths = result.write(args.output_dir)
+        folder = os.path.dirname(problem_paths[0])
+        det_path = os.path.join(folder, f"{result.domain_name}_domain_all_outcomes.pddl")
+        with open(det_path, "w") as f:
+            f.write(det.to_pddl())
+        print(f"{file_path}: {len(det.actions)} deterministic actions -> {det_path}")
+
+        if args.check:
+            for problem_name, text in result.problems.items():
+                problem = parse_problem(text)
+                plan, expanded = find_plan(det, problem.init, problem.goal, args.max_states)
+                if plan is None:
+                    exit_code = 1
+                    print(f"  {problem_name}: no path to the goal ({expanded} states)")
+                else:
+                    print(f"  {problem_name}: path of {len(plan)} steps ({expanded} states)")
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import argparse
+import os
+import re
+import sys
+
+from reachability import ReachabilityIndex
+from read_bpmn_tasks_v2 import BPMNParser, TranslationResult, bpmn_stem, sanitize_name
+from sese_fragments import split_action_blocks
+
+ALWAYS_KEPT_PREDICATES = {"done", "started"}
+
+def backward_slice(graph, target_id, backward_index=None):
+    # Elements that can still lead to target_id. The flow graph already holds
+    # the synthetic message flows, and every predecessor of a parallel or
+    # inclusive join is pulled in by the walk itself, since the join needs them.
+    if backward_index is None:
+        backward_index = ReachabilityIndex(graph.incoming)
+    return backward_index.reachable([target_id]) | {target_id}
+
+def slice_domain(domain, action_origins, relevant, domain_name=None):
+    # Drop every action whose originating elements all lie outside the slice,
+    # then every predicate no surviving action mentions. Surviving actions are
+    # kept verbatim, including nondeterministic outcomes that leave the slice,
+    # so the sliced domain has exactly the original behaviour up to the goal.
+    blocks = split_action_blocks(domain)
+    dropped = [
+        name for name, origins in action_origins.items()
+        if name in blocks and not any(o in relevant for o in origins)
+    ]
+    kept_actions = {name: origins for name, origins in action_origins.items() if name not in dropped}
+
+    sliced = domain
+    for name in dropped:
+        sliced = sliced.replace(f"  {blocks[name]}\n\n", "", 1)
+
+    referenced = set(ALWAYS_KEPT_PREDICATES)
+    for name in kept_actions:
+        if name in blocks:
+            referenced.update(re.findall(r"\(([A-Za-z0-9_]+)\)", blocks[name]))
+
+    lines = []
+    predicates = []
+    in_predicates = False
+    for line in sliced.split("\n"):
+        if line.strip() == "(:predicates":
+            in_predicates = True
+        elif in_predicates and line.strip() == ")":
+            in_predicates = False
+        elif in_predicates:
+            pred = line.strip()[1:-1]
+            if pred not in referenced:
+                continue
+            if pred not in ALWAYS_KEPT_PREDICATES:
+                predicates.append(pred)
+        lines.append(line)
+    sliced = "\n".join(lines)
+
+    if domain_name:
+        sliced = re.sub(r"^\(define \(domain [^)]*\)", f"(define (domain {domain_name})", sliced, count=1)
+    return sliced, sorted(set(predicates)), kept_actions
+
+def slice_translations(parser, domain_name="bpmn-generated", end_ids=None, full=None):
+    # {end_event_id: TranslationResult} with one sliced domain per end event.
+    # full is the (domain, predicates, action origins) triple from
+    # generate_pddl_domain_with_origins when the caller already has it.
+    graph = parser.build_flow_graph()
+    if full is None:
+        full = parser.generate_pddl_domain_with_origins(domain_name)
+    domain, _, action_origins = full
+    start_events = [e.id for e in parser.get_process_start_events()]
+    end_events = [e.id for e in graph.elements if e.type == "End Event"]
+
+    # One closure over the reversed graph answers every end event's slice
+    backward_index = ReachabilityIndex(graph.incoming, [e.id for e in graph.elements])
+    backward_index.closure()
+    results = {}
+    for end_id in end_ids or end_events:
+        if end_id not in graph.elements_by_id:
+            raise ValueError(f"Unknown end event: {end_id}")
+        relevant = backward_slice(graph, end_id, backward_index)
+        slice_name = f"{domain_name}-{sanitize_name(end_id)}"
+        sliced, predicates, kept = slice_domain(domain, action_origins, relevant, slice_name)
+        slice_starts = [s for s in start_events if s in relevant]
+        problems = parser.generate_problem_texts(slice_starts, predicates, slice_name)
+        results[end_id] = TranslationResult(slice_name, sliced, problems, predicates, parser.elements, slice_starts, kept)
+    return results
+
+def write_slices(results, bpmn_filename, output_dir=None):
+    # <output_dir>/<name>/not_flattened/slices/<end event>/{domain,p0,p01...}.pddl
+    folder = os.path.join(output_dir or os.getcwd(), bpmn_filename, "not_flattened", "slices")
+    written = {}
+    for end_id, result in results.items():
+        slice_folder = os.path.join(folder, sanitize_name(end_id))
+        os.makedirs(slice_folder, exist_ok=True)
+        domain_path = os.path.join(slice_folder, f"{bpmn_filename}_domain_no_flatten.pddl")
+        with open(domain_path, "w") as f:
+            f.write(result.domain)
+        for problem_name, content in result.problems.items():
+            with open(os.path.join(slice_folder, f"{problem_name}.pddl"), "w") as f:
+                f.write(content)
+        written[end_id] = slice_folder
+    return written
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Emit one backward-sliced PDDL domain per BPMN end event.")
+    arg_parser.add_argument("file")
+    arg_parser.add_argument("--end", action="append", default=None, help="end event id to slice for (repeatable; default: every end event)")
+    arg_parser.add_argument("-o", "--output-dir", default=None)
+    args = arg_parser.parse_args(argv)
+
+    bpmn_filename = bpmn_stem(args.file)
+    parser = BPMNParser(args.file)
+    parser.parse()
+    full = parser.generate_pddl_domain_with_origins(bpmn_filename)
+    results = slice_translations(parser, bpmn_filename, args.end, full)
+    folders = write_slices(results, bpmn_filename, args.output_dir)
+
+    full_domain, full_predicates, _ = full
+    print(f"full domain: {full_domain.count('(:action ')} actions, {len(full_predicates)} predicates")
+    for end_id, result in results.items():
+        print(f"{end_id}: {result.action_count} actions, {len(result.predicates)} predicates -> {folders[end_id]}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import itertools
+import re
+
+# Small object model for the PDDL this translator emits: propositional
+# domains (no parameters) with and/not/oneof/when, and problems with a ground
+# :init and :goal. Formulas are nested lists, e.g. ["and", ["X"], ["not", ["Y"]]].
+
+TOKEN_RE = re.compile(r";[^\n]*|\(|\)|[^\s()]+")
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text) if not t.startswith(";")]
+
+def parse_sexpr(text):
+    stack = [[]]
+    for token in tokenize(text):
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) == 1:
+                raise ValueError("Unbalanced ')' in PDDL")
+            done = stack.pop()
+            stack[-1].append(done)
+        else:
+            stack[-1].append(token.lower() if token.startswith(":") else token)
+    if len(stack) != 1:
+        raise ValueError("Unbalanced '(' in PDDL")
+    if len(stack[0]) != 1:
+        raise ValueError("Expected exactly one top-level PDDL expression")
+    return stack[0][0]
+
+def format_sexpr(expr):
+    if isinstance(expr, str):
+        return expr
+    return "(" + " ".join(format_sexpr(e) for e in expr) + ")"
+
+def is_atom(expr):
+    return isinstance(expr, list) and (not expr or expr[0] not in ("and", "not", "oneof", "when", "or"))
+
+def atom_name(expr):
+    return expr[0] if expr else ""
+
+class Action:
+    def __init__(self, name, precondition, effect):
+        self.name = name
+        self.precondition = precondition
+        self.effect = effect
+
+    def to_pddl(self):
+        return (
+            f"  (:action {self.name}\n"
+            f"    :precondition {format_sexpr(self.precondition)}\n"
+            f"    :effect {format_sexpr(self.effect)}\n"
+            "  )\n"
+        )
+
+class Domain:
+    def __init__(self, name, requirements, types, predicates, actions):
+        self.name = name
+        self.requirements = requirements
+        self.types = types
+        self.predicates = predicates
+        self.actions = actions
+
+    @property
+    def actions_by_name(self):
+        return {a.name: a for a in self.actions}
+
+    def to_pddl(self):
+        text = f"(define (domain {self.name})\n"
+        text += f"  (:requirements {' '.join(self.requirements)})\n"
+        if self.types:
+            text += f"  (:types {' '.join(self.types)})\n"
+        text += "\n  (:predicates\n"
+        for pred in self.predicates:
+            text += f"    ({pred})\n"
+        text += "  )\n\n"
+        for action in self.actions:
+            text += action.to_pddl() + "\n"
+        text += ")"
+        return text
+
+class Problem:
+    def __init__(self, name, domain_name, objects, init, goal):
+        self.name = name
+        self.domain_name = domain_name
+        self.objects = objects
+        self.init = init        # frozenset of true atom names
+        self.goal = goal
+
+    def to_pddl(self):
+        text = f"(define (problem {self.name})\n"
+        text += f"  (:domain {self.domain_name})\n"
+        text += f"  (:objects {' '.join(self.objects)})\n"
+        text += f"  (:init {' '.join(f'({a})' for a in sorted(self.init))})\n"
+        text += f"  (:goal {format_sexpr(self.goal)})\n"
+        text += ")"
+        return text
+
+def parse_domain(text):
+    expr = parse_sexpr(text)
+    if not expr or expr[0] != "define":
+        raise ValueError("Not a PDDL domain")
+    name = None
+    requirements = []
+    types = []
+    predicates = []
+    actions = []
+    for section in expr[1:]:
+        head = section[0]
+        if head == "domain":
+            name = section[1]
+        elif head == ":requirements":
+            requirements = section[1:]
+        elif head == ":types":
+            types = section[1:]
+        elif head == ":predicates":
+            predicates = [atom_name(p) for p in section[1:]]
+        elif head == ":action":
+            fields = dict(zip(section[2::2], section[3::2]))
+            actions.append(Action(
+                section[1],
+                fields.get(":precondition", ["and"]),
+                fields.get(":effect", ["and"]),
+            ))
+    return Domain(name, requirements, types, predicates, actions)
+
+def parse_problem(text):
+    expr = parse_sexpr(text)
+    if not expr or expr[0] != "define":
+        raise ValueError("Not a PDDL problem")
+    name = domain_name = None
+    objects = []
+    init = []
+    goal = ["and"]
+    for section in expr[1:]:
+        head = section[0]
+        if head == "problem":
+            name = section[1]
+        elif head == ":domain":
+            domain_name = section[1]
+        elif head == ":objects":
+            objects = section[1:]
+        elif head == ":init":
+            init = [atom_name(a) for a in section[1:] if is_atom(a)]
+        elif head == ":goal":
+            goal = section[1]
+    return Problem(name, domain_name, objects, frozenset(init), goal)
+
+def holds(formula, state):
+    # Evaluate a precondition/goal/condition against a set of true atoms
+    if is_atom(formula):
+        return atom_name(formula) in state
+    head = formula[0]
+    if head == "and":
+        return all(holds(f, state) for f in formula[1:])
+    if head == "or":
+        return any(holds(f, state) for f in formula[1:])
+    if head == "not":
+        return not holds(formula[1], state)
+    raise ValueError(f"Unsupported formula: {format_sexpr(formula)}")
+
+def effect_outcomes(effect):
+    # All deterministic effects a (possibly nondeterministic) effect can have:
+    # every oneof picks one branch, and independent oneofs multiply
+    if is_atom(effect) or effect[0] == "not":
+        return [effect]
+    head = effect[0]
+    if head == "and":
+        choices = [effect_outcomes(e) for e in effect[1:]]
+        return [["and", *combo] for combo in itertools.product(*choices)]
+    if head == "oneof":
+        return [outcome for branch in effect[1:] for outcome in effect_outcomes(branch)]
+    if head == "when":
+        return [["when", effect[1], outcome] for outcome in effect_outcomes(effect[2])]
+    raise ValueError(f"Unsupported effect: {format_sexpr(effect)}")
+
+def flatten_and(expr):
+    # (and (and A B) (and) C) -> (and A B C); other structure is left alone
+    if is_atom(expr) or expr[0] == "not":
+        return expr
+    if expr[0] == "and":
+        flat = ["and"]
+        for child in expr[1:]:
+            child = flatten_and(child)
+            if not is_atom(child) and child[0] == "and":
+                flat.extend(child[1:])
+            else:
+                flat.append(child)
+        return flat
+    return [expr[0]] + [flatten_and(e) if isinstance(e, list) else e for e in expr[1:]]
+
+def collect_effect(effect, state, adds, deletes):
+    # Conditions of `when` are evaluated on the state before the action
+    if is_atom(effect):
+        if effect:
+            adds.add(atom_name(effect))
+        return
+    head = effect[0]
+    if head == "not":
+        deletes.add(atom_name(effect[1]))
+    elif head == "and":
+        for e in effect[1:]:
+            collect_effect(e, state, adds, deletes)
+    elif head == "when":
+        if holds(effect[1], state):
+            collect_effect(effect[2], state, adds, deletes)
+    else:
+        raise ValueError(f"Effect is not deterministic: {format_sexpr(effect)}")
+
+def apply_effect(effect, state):
+    adds = set()
+    deletes = set()
+    collect_effect(effect, state, adds, deletes)
+    return frozenset((state - deletes) | adds)
+
+def uses(expr, keyword):
+    if isinstance(expr, str):
+        return False
+    return bool(expr) and (expr[0] == keyword or any(uses(e, keyword) for e in expr))
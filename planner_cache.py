@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; eviction is then unlocked
+    fcntl = None
+
+from pddl_model import tokenize
+
+# Persistent cache of planner outcomes. An entry is a directory named by the
+# SHA-256 of the canonical domain, the canonical problem and the planner
+# arguments, holding entry.json, policy.out (if any) and the planner log.
+# Entries are published with an atomic rename and evicted least recently
+# used first once the cache grows past its size cap.
+
+ENTRY_FILE = "entry.json"
+CACHED_FILES = ("policy.out", "planner.log")
+CACHEABLE_STATUSES = ("solved",)     # failures may be transient or limit-dependent
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def canonical_pddl(text):
+    # Comments, whitespace and keyword case do not change the task
+    return " ".join(t.lower() if t.startswith(":") else t for t in tokenize(text))
+
+def cache_key(domain_text, problem_text, planner_args):
+    digest = hashlib.sha256()
+    for part in (canonical_pddl(domain_text), canonical_pddl(problem_text), json.dumps(planner_args)):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class PlannerCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def entry_dir(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    @contextmanager
+    def locked(self):
+        # Serializes eviction between processes and threads; lookups and
+        # stores do not need it because entries appear and vanish atomically
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def get(self, key, workdir=None):
+        # Entry dict, or None; cached files are copied into workdir if given.
+        # An entry evicted while being read counts as a miss.
+        folder = self.entry_dir(key)
+        try:
+            with open(os.path.join(folder, ENTRY_FILE)) as f:
+                entry = json.load(f)
+            if entry.get("status") not in CACHEABLE_STATUSES:
+                # Left by an older version that also cached failures
+                raise ValueError(entry.get("status"))
+            if workdir:
+                os.makedirs(workdir, exist_ok=True)
+                for name in CACHED_FILES:
+                    if os.path.exists(os.path.join(folder, name)):
+                        shutil.copyfile(os.path.join(folder, name), os.path.join(workdir, name))
+            os.utime(os.path.join(folder, ENTRY_FILE))     # recency for LRU
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry, workdir):
+        # Store a solved run together with its policy; anything else is
+        # planned again next time
+        if entry.get("status") not in CACHEABLE_STATUSES or not os.path.exists(os.path.join(workdir, CACHED_FILES[0])):
+            return False
+        os.makedirs(os.path.join(self.directory, key[:2]), exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        try:
+            for name in CACHED_FILES:
+                if os.path.exists(os.path.join(workdir, name)):
+                    shutil.copyfile(os.path.join(workdir, name), os.path.join(staging, name))
+            stored = {k: entry.get(k) for k in ("status", "returncode", "seconds", "strong_cyclic")}
+            stored["stored_at"] = time.time()
+            with open(os.path.join(staging, ENTRY_FILE), "w") as f:
+                json.dump(stored, f, indent=2)
+            try:
+                os.rename(staging, self.entry_dir(key))
+            except OSError:
+                # Another worker stored the same key first; keep theirs
+                shutil.rmtree(staging, ignore_errors=True)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+        self.evict()
+        return True
+
+    def entries(self):
+        # [(last used, size in bytes, folder)]
+        found = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir() or shard.name.startswith("."):
+                continue
+            for folder in os.scandir(shard.path):
+                if folder.name.endswith(".evicted"):
+                    continue
+                try:
+                    used = os.stat(os.path.join(folder.path, ENTRY_FILE)).st_mtime
+                    size = sum(f.stat().st_size for f in os.scandir(folder.path))
+                except OSError:
+                    continue
+                found.append((used, size, folder.path))
+        return found
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        with self.locked():
+            found = sorted(self.entries())
+            total = sum(size for _, size, _ in found)
+            removed = 0
+            for _, size, folder in found:
+                if total <= self.max_bytes:
+                    break
+                # Rename first so readers never see a half-deleted entry
+                doomed = folder + ".evicted"
+                try:
+                    os.rename(folder, doomed)
+                except OSError:
+                    continue
+                shutil.rmtree(doomed, ignore_errors=True)
+                total -= size
+                removed += 1
+            return removed
@@ -0,0 +1,234 @@
+import argparse
+import copy
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from goal_slicing import slice_translations
+from pddl_model import parse_domain, parse_problem
+from planner_runner import POLICY_FILE, PlannerJob, run_job
+from policy_index import load_policy
+from policy_verify import PolicyTable, verify_policy
+from read_bpmn_tasks_v2 import BPMNParser, TranslationResult, bpmn_stem
+from state_explorer import CompiledDomain
+
+# Portfolio race: several encodings of one parsed diagram, each paired with
+# every planner configuration, are planned concurrently. The first policy that
+# verifies as strong cyclic wins, the other planners are killed, and the win
+# is recorded so later races for the same diagram start with the
+# contestants that won before.
+
+HISTORY_FILE = "race_history.json"
+RESULT_FILE = "race.json"
+
+def full_encoding(parser, domain_name, flattened=False):
+    domain, predicates, origins = parser.generate_pddl_domain_with_origins(domain_name)
+    start_events = [e.id for e in parser.get_process_start_events()]
+    problems = parser.generate_problem_texts(start_events, predicates, domain_name, flattened)
+    return TranslationResult(domain_name, domain, problems, predicates, parser.elements, start_events, origins, flattened)
+
+def sliced_encoding(parser, domain_name):
+    # The backward slice only solves the whole task when there is a single
+    # end event; with several, each slice is a different goal
+    slices = slice_translations(parser, domain_name)
+    return next(iter(slices.values())) if len(slices) == 1 else None
+
+def flattened_encoding(parser, domain_name):
+    # Only worth racing when there is a merge to unroll and it fits the budget
+    flat = copy.copy(parser)
+    try:
+        if not flat.flatten_diagram():
+            return None
+    except ValueError:
+        return None
+    return full_encoding(flat, domain_name, flattened=True)
+
+# name -> function(parser, domain name) returning a TranslationResult, or None
+# when the encoding does not apply to the diagram
+ENCODINGS = {
+    "full": full_encoding,
+    "sliced": sliced_encoding,
+    "flattened": flattened_encoding,
+}
+
+def planner_key(template):
+    # Names a planner configuration by its command rather than its position
+    # among the --planner options, so history survives reordering them
+    return "planner-" + hashlib.sha256(template.encode()).hexdigest()[:12]
+
+class Contestant:
+    def __init__(self, encoding, template, result, problem_name):
+        self.encoding = encoding
+        self.template = template
+        self.result = result
+        self.problem_name = problem_name
+
+    @property
+    def name(self):
+        return f"{self.encoding}+{planner_key(self.template)}"
+
+def problem_for(result, start_event):
+    # Problems are p0 and then one per start event, in start event order
+    if start_event not in result.start_events:
+        return None
+    return list(result.problems)[result.start_events.index(start_event) + 1]
+
+def diagram_digest(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_history(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def record_win(path, diagram, digest, winner, seconds):
+    # {diagram: {"wins": {contestant: n}, "races": [...]}}; keyed by name so
+    # the preference survives edits to the diagram
+    history = load_history(path)
+    entry = history.setdefault(diagram, {"wins": {}, "races": []})
+    if winner:
+        entry["wins"][winner] = entry["wins"].get(winner, 0) + 1
+    entry["races"].append({"winner": winner, "seconds": round(seconds, 6), "digest": digest, "at": time.time()})
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp, path)
+
+def by_preference(contestants, history_entry):
+    wins = (history_entry or {}).get("wins", {})
+    return sorted(contestants, key=lambda c: -wins.get(c.name, 0))
+
+def build_contestants(file_path, templates, encodings, start_event=None):
+    domain_name = bpmn_stem(file_path)
+    parser = BPMNParser(file_path)
+    parser.parse()
+    start_event = start_event or next((e.id for e in parser.get_process_start_events()), None)
+    contestants = []
+    for encoding in encodings:
+        result = ENCODINGS[encoding](parser, domain_name)
+        problem_name = problem_for(result, start_event) if result else None
+        if problem_name is None:
+            continue
+        for template in dict.fromkeys(templates):
+            contestants.append(Contestant(encoding, template, result, problem_name))
+    return contestants
+
+def validate(contestant, policy_path):
+    result = contestant.result
+    compiled = CompiledDomain(parse_domain(result.domain))
+    problem = parse_problem(result.problems[contestant.problem_name])
+    table = PolicyTable(load_policy(policy_path), compiled)
+    return verify_policy(compiled, table, compiled.encode(problem.init), problem.goal).strong_cyclic
+
+def race(contestants, race_dir, timeout=None, memory_mb=None, workers=None, on_line=None):
+    # (winner or None, {contestant name: manifest entry with "valid"})
+    stop = threading.Event()
+    jobs = {}
+    for c in contestants:
+        folder = os.path.join(race_dir, c.name)
+        os.makedirs(folder, exist_ok=True)
+        domain_file = "_domain.pddl" if c.result.flattened else "_domain_no_flatten.pddl"
+        domain_path = os.path.join(folder, c.result.domain_name + domain_file)
+        problem_path = os.path.join(folder, f"{c.problem_name}.pddl")
+        with open(domain_path, "w") as f:
+            f.write(c.result.domain)
+        with open(problem_path, "w") as f:
+            f.write(c.result.problems[c.problem_name])
+        jobs[c.name] = PlannerJob(c.problem_name, domain_path, problem_path, os.path.join(folder, "run"))
+
+    winner = None
+    entries = {}
+    lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=workers or len(contestants) or 1) as pool:
+        def run(c):
+            if stop.is_set():
+                return c, {"status": "cancelled", "seconds": 0.0, "policy": None}
+            return c, run_job(jobs[c.name], c.template, timeout, memory_mb, on_line, stop=stop)
+        futures = [pool.submit(run, c) for c in contestants]
+        for future in as_completed(futures):
+            c, entry = future.result()
+            entry["valid"] = False
+            if entry["status"] == "solved" and entry.get("policy"):
+                try:
+                    entry["valid"] = validate(c, entry["policy"])
+                except ValueError:
+                    pass
+            with lock:
+                entries[c.name] = entry
+                if entry["valid"] and winner is None:
+                    winner = c
+                    stop.set()
+    return winner, entries
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Race several encodings and planner configurations and keep the first valid policy.")
+    arg_parser.add_argument("file", help="BPMN diagram")
+    arg_parser.add_argument("--planner", action="append", required=True, help="planner command (repeatable); {domain}, {problem} and {workdir} are substituted")
+    arg_parser.add_argument("--encoding", action="append", choices=sorted(ENCODINGS), default=None, help="encodings to race (default: all that apply)")
+    arg_parser.add_argument("--start", default=None, help="start event whose problem is raced (default: the first)")
+    arg_parser.add_argument("-o", "--output-dir", default=None)
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="concurrent planners (default: all contestants)")
+    arg_parser.add_argument("--timeout", type=float, default=None)
+    arg_parser.add_argument("--memory", type=int, default=None)
+    arg_parser.add_argument("--history", default=None, help=f"win history file (default: {HISTORY_FILE} in the output directory)")
+    arg_parser.add_argument("--prefer", action="store_true", help="run the historically best contestant alone first and race the rest only if it fails")
+    arg_parser.add_argument("-q", "--quiet", action="store_true")
+    args = arg_parser.parse_args(argv)
+
+    output_dir = args.output_dir or os.getcwd()
+    name = bpmn_stem(args.file)
+    race_dir = os.path.join(output_dir, name, "race")
+    history_path = args.history or os.path.join(output_dir, HISTORY_FILE)
+    contestants = build_contestants(args.file, args.planner, args.encoding or list(ENCODINGS), args.start)
+    if not contestants:
+        print(f"{args.file}: no encoding produced a problem to race", file=sys.stderr)
+        return 2
+    contestants = by_preference(contestants, load_history(history_path).get(name))
+
+    print_lock = threading.Lock()
+    def on_line(job, line):
+        with print_lock:
+            print(f"[{os.path.basename(os.path.dirname(job.workdir))}] {line}", flush=True)
+
+    started = time.perf_counter()
+    rounds = [contestants[:1], contestants[1:]] if args.prefer and len(contestants) > 1 else [contestants]
+    winner = None
+    entries = {}
+    for round_contestants in rounds:
+        winner, round_entries = race(round_contestants, race_dir, args.timeout, args.memory, args.workers,
+                                     None if args.quiet else on_line)
+        entries.update(round_entries)
+        if winner:
+            break
+    seconds = time.perf_counter() - started
+
+    record_win(history_path, name, diagram_digest(args.file), winner.name if winner else None, seconds)
+    summary = {
+        "diagram": args.file,
+        "winner": winner.name if winner else None,
+        "policy": entries[winner.name]["policy"] if winner else None,
+        "seconds": round(seconds, 6),
+        "planners": {planner_key(t): t for t in args.planner},
+        "contestants": {n: {k: e.get(k) for k in ("status", "seconds", "valid", "policy")} for n, e in entries.items()},
+    }
+    os.makedirs(race_dir, exist_ok=True)
+    with open(os.path.join(race_dir, RESULT_FILE), "w") as f:
+        json.dump(summary, f, indent=2)
+    for n, e in entries.items():
+        mark = " <- winner" if winner and n == winner.name else ""
+        print(f"{e['status']:<9} {n} ({e['seconds']:.3f}s{', valid' if e['valid'] else ''}){mark}")
+    if not winner:
+        print(f"{args.file}: no contestant produced a valid policy")
+        return 1
+    print(f"{args.file}: {winner.name} won in {seconds:.3f}s -> {os.path.join(race_dir, winner.name, 'run', POLICY_FILE)}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
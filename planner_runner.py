@@ -0,0 +1,278 @@
+import argparse
+import glob
+import json
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # not available on Windows; memory limits are skipped
+    resource = None
+
+from planner_cache import DEFAULT_MAX_BYTES, PlannerCache, cache_key
+from policy_index import load_policy
+from policy_reuse import check_reuse
+from read_bpmn_tasks_v2 import translate
+
+POLICY_FILE = "policy.out"
+LOG_FILE = "planner.log"
+MANIFEST_FILE = "manifest.json"
+STRONG_CYCLIC_MARKER = "Strong cyclic solution found"
+OUT_OF_MEMORY_MARKERS = ("MemoryError", "bad_alloc", "Cannot allocate memory", "Memory limit")
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_NO_INPUTS = 2
+
+class PlannerJob:
+    def __init__(self, problem_name, domain_path, problem_path, workdir):
+        self.problem_name = problem_name
+        self.domain_path = domain_path
+        self.problem_path = problem_path
+        self.workdir = workdir          # planner cwd; policy.out lands here
+
+    def cache_key(self, template):
+        with open(self.domain_path) as f:
+            domain = f.read()
+        with open(self.problem_path) as f:
+            problem = f.read()
+        return cache_key(domain, problem, shlex.split(template))
+
+    def command(self, template):
+        # {domain}, {problem} and {workdir} are substituted per argument, so
+        # paths with spaces survive
+        values = {"domain": self.domain_path, "problem": self.problem_path, "workdir": self.workdir}
+        return [arg.format(**values) for arg in shlex.split(template)]
+
+def find_jobs(not_flattened_folder):
+    # The domain and problems that generate_problem_files wrote, p0 first
+    folder = os.path.abspath(not_flattened_folder)
+    domains = sorted(glob.glob(os.path.join(folder, "*_domain_no_flatten.pddl")))
+    if not domains:
+        raise FileNotFoundError(f"No *_domain_no_flatten.pddl in {folder}")
+    problems = sorted(glob.glob(os.path.join(folder, "p0*.pddl")), key=lambda p: (len(p), p))
+    runs = os.path.join(folder, "runs")
+    return [
+        PlannerJob(os.path.basename(p)[:-5], domains[0], p, os.path.join(runs, os.path.basename(p)[:-5]))
+        for p in problems
+    ]
+
+# Sets the address-space limit and then becomes the planner. The limit is
+# applied by this wrapper process rather than with preexec_fn, which is not
+# safe to use when jobs are started from worker threads.
+MEMORY_WRAPPER = (
+    "import os, resource, sys\n"
+    "limit = int(sys.argv[1])\n"
+    "resource.setrlimit(resource.RLIMIT_AS, (limit, limit))\n"
+    "os.execv(sys.argv[2], sys.argv[2:])\n"
+)
+
+def limit_memory(command, memory_mb):
+    # The command run under the wrapper; the planner is looked up here so a
+    # missing executable fails like it would without a limit
+    executable = shutil.which(command[0])
+    if executable is None:
+        raise FileNotFoundError(f"No such file or directory: {command[0]!r}")
+    return [sys.executable, "-c", MEMORY_WRAPPER, str(memory_mb * 1024 * 1024), executable, *command[1:]]
+
+def reuse_previous(job, policy_path):
+    # Number of broken states when the policy left by an earlier run is
+    # checked against the current domain; 0 means it can be kept as it is
+    with open(job.domain_path) as f:
+        domain = f.read()
+    with open(job.problem_path) as f:
+        problem = f.read()
+    try:
+        _, _, report = check_reuse(load_policy(policy_path), domain, problem, {})
+    except ValueError:
+        return None
+    return 0 if report.reusable else len(report.broken_states) or len(report.verification.failures)
+
+def run_job(job, template, timeout=None, memory_mb=None, on_line=None, cache=None, reuse=False, stop=None):
+    # Never raises; returns the manifest entry for the job. Setting the
+    # threading.Event stop kills the planner (status "cancelled").
+    os.makedirs(job.workdir, exist_ok=True)
+    policy_path = os.path.join(job.workdir, POLICY_FILE)
+    log_path = os.path.join(job.workdir, LOG_FILE)
+    entry = {
+        "problem": job.problem_name,
+        "problem_file": job.problem_path,
+        "workdir": job.workdir,
+        "log": log_path,
+        "cached": False,
+    }
+    if os.path.exists(policy_path):
+        if reuse:
+            started = time.perf_counter()
+            broken = reuse_previous(job, policy_path)
+            if broken == 0:
+                entry.update(status="solved", reused=True, returncode=None, policy=policy_path, strong_cyclic=True,
+                             seconds=round(time.perf_counter() - started, 6))
+                return entry
+            entry["reuse_broken_states"] = broken
+        os.remove(policy_path)
+    key = job.cache_key(template) if cache else None
+    if cache:
+        hit = cache.get(key, job.workdir)
+        if hit is not None:
+            entry.update(hit, cached=True, policy=policy_path if os.path.exists(policy_path) else None)
+            entry.pop("stored_at", None)
+            return entry
+    started = time.perf_counter()
+    try:
+        command = job.command(template)
+        if memory_mb and resource:
+            command = limit_memory(command, memory_mb)
+        process = subprocess.Popen(
+            command,
+            cwd=job.workdir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            start_new_session=True,
+        )
+    except OSError as exc:
+        entry.update(status="error", error=f"{type(exc).__name__}: {exc}", returncode=None,
+                     seconds=round(time.perf_counter() - started, 6), policy=None, strong_cyclic=False)
+        return entry
+
+    # The planner runs in its own session so a timeout kills its children too
+    timed_out = threading.Event()
+    cancelled = threading.Event()
+    def kill(reason=timed_out):
+        reason.set()
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    watchdog = threading.Timer(timeout, kill) if timeout else None
+    if watchdog:
+        watchdog.start()
+    if stop is not None:
+        def watch_stop():
+            while process.poll() is None:
+                if stop.wait(0.05):
+                    kill(cancelled)
+                    return
+        threading.Thread(target=watch_stop, daemon=True).start()
+
+    strong_cyclic = False
+    out_of_memory = False
+    with open(log_path, "w") as log:
+        for line in process.stdout:
+            log.write(line)
+            strong_cyclic |= STRONG_CYCLIC_MARKER in line
+            out_of_memory |= any(m in line for m in OUT_OF_MEMORY_MARKERS)
+            if on_line:
+                on_line(job, line.rstrip("\n"))
+    returncode = process.wait()
+    if watchdog:
+        watchdog.cancel()
+
+    has_policy = os.path.exists(policy_path)
+    if cancelled.is_set():
+        status = "cancelled"
+    elif timed_out.is_set():
+        status = "timeout"
+    elif returncode != 0 and (out_of_memory or (memory_mb and returncode < 0)):
+        status = "memory"
+    elif returncode != 0:
+        status = "failed"
+    elif not has_policy:
+        status = "no-policy"
+    else:
+        status = "solved"
+    entry.update(
+        status=status,
+        returncode=returncode,
+        seconds=round(time.perf_counter() - started, 6),
+        policy=policy_path if has_policy else None,
+        strong_cyclic=strong_cyclic,
+    )
+    if cache:
+        cache.put(key, entry, job.workdir)
+    return entry
+
+def run_jobs(jobs, template, workers=None, timeout=None, memory_mb=None, on_line=None, cache=None, reuse=False):
+    with ThreadPoolExecutor(max_workers=workers or len(jobs) or 1) as pool:
+        futures = [pool.submit(run_job, job, template, timeout, memory_mb, on_line, cache, reuse) for job in jobs]
+        return [f.result() for f in futures]
+
+def write_manifest(folder, domain_path, template, entries, timeout=None, memory_mb=None):
+    manifest = {
+        "domain": domain_path,
+        "command": template,
+        "timeout": timeout,
+        "memory_mb": memory_mb,
+        "solved": sum(1 for e in entries if e["status"] == "solved"),
+        "cached": sum(1 for e in entries if e.get("cached")),
+        "reused": sum(1 for e in entries if e.get("reused")),
+        "total": len(entries),
+        "jobs": entries,
+    }
+    path = os.path.join(folder, "runs", MANIFEST_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return path, manifest
+
+def resolve_folder(path, output_dir=None):
+    # A diagram is translated first; a folder is used as it is
+    if os.path.isdir(path):
+        nested = os.path.join(path, "not_flattened")
+        return nested if os.path.isdir(nested) else path
+    result = translate(path)
+    domain_path, _ = result.write(output_dir)
+    return os.path.dirname(domain_path)
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Run a local planner on every generated problem concurrently and collect the policies.")
+    arg_parser.add_argument("inputs", nargs="+", help="BPMN diagrams or generated <name>/not_flattened folders")
+    arg_parser.add_argument("--planner", required=True, help="planner command; {domain}, {problem} and {workdir} are substituted")
+    arg_parser.add_argument("-o", "--output-dir", default=None, help="where diagrams given as input are translated to")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="concurrent planner processes (default: one per problem)")
+    arg_parser.add_argument("--timeout", type=float, default=None, help="seconds per problem")
+    arg_parser.add_argument("--memory", type=int, default=None, help="address-space limit per planner process in MB")
+    arg_parser.add_argument("--cache", default=None, help="directory of the persistent planner result cache")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="cache size cap in MB")
+    arg_parser.add_argument("--reuse", action="store_true", help="keep a policy from an earlier run if it still verifies against the current domain")
+    arg_parser.add_argument("-q", "--quiet", action="store_true", help="do not stream planner output")
+    args = arg_parser.parse_args(argv)
+
+    print_lock = threading.Lock()
+    def on_line(job, line):
+        with print_lock:
+            print(f"[{job.problem_name}] {line}", flush=True)
+
+    cache = PlannerCache(args.cache, args.cache_size * 1024 * 1024) if args.cache else None
+    exit_code = EXIT_OK
+    found_any = False
+    for path in args.inputs:
+        folder = resolve_folder(path, args.output_dir)
+        jobs = find_jobs(folder)
+        if not jobs:
+            continue
+        found_any = True
+        entries = run_jobs(jobs, args.planner, args.workers, args.timeout, args.memory, None if args.quiet else on_line, cache, args.reuse)
+        manifest_path, manifest = write_manifest(folder, jobs[0].domain_path, args.planner, entries, args.timeout, args.memory)
+        for entry in entries:
+            cached = ", cached" if entry.get("cached") else ", reused" if entry.get("reused") else ""
+            print(f"{entry['status']:<9} {entry['problem']} ({entry['seconds']:.3f}s{cached})")
+        print(f"{path}: {manifest['solved']}/{manifest['total']} solved -> {manifest_path}")
+        if manifest["solved"] != manifest["total"]:
+            exit_code = EXIT_FAILURES
+    if not found_any:
+        print("No generated problems found in the given inputs", file=sys.stderr)
+        return EXIT_NO_INPUTS
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+
+from pddl_model import parse_domain, parse_problem
+from policy_index import load_policy
+from policy_verify import PolicyTable, find_policies, load_task
+from read_bpmn_tasks_v2 import sanitize_name, translate
+from state_explorer import CompiledDomain
+
+# Compiles a policy into a table from concrete states to prescribed actions,
+# so the runtime never matches partial states: a state is an int whose bits
+# follow the predicate table (done, started, then the translator's sorted
+# predicates), and the next action is one dict lookup. Every state the policy
+# can reach from the problem's init is enumerated at compile time, together
+# with the successor states of its action.
+
+COMPILED_SUFFIX = ".compiled.json"
+
+class CompiledPolicy:
+    def __init__(self, predicates, actions, origins, init, table):
+        self.predicates = predicates    # bit i is predicates[i]
+        self.actions = actions          # action names
+        self.origins = origins          # origin element id per action, or None
+        self.init = init
+        self.table = table              # {state: (action index or -1 at the goal, (successor states))}
+
+    def to_json(self):
+        return {
+            "predicates": self.predicates,
+            "actions": self.actions,
+            "origins": self.origins,
+            "init": format(self.init, "x"),
+            "states": {format(s, "x"): [a, [format(t, "x") for t in succ]] for s, (a, succ) in self.table.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        table = {int(s, 16): (a, tuple(int(t, 16) for t in succ)) for s, (a, succ) in data["states"].items()}
+        return cls(data["predicates"], data["actions"], data["origins"], int(data["init"], 16), table)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_json(json.load(f))
+
+def compile_policy(policy, domain_text, problem_text, predicates=None, action_origins=None):
+    # Raises ValueError if the policy has no move in a state it can reach
+    domain = parse_domain(domain_text)
+    domain.predicates = list(predicates) if predicates is not None else sorted(domain.predicates)
+    compiled = CompiledDomain(domain)
+    problem = parse_problem(problem_text)
+    table = PolicyTable(policy, compiled)
+    goal_pos, goal_neg = compiled.literals(problem.goal)
+
+    origins = {a.lower(): o[0] for a, o in (action_origins or {}).items() if o}
+    actions = []
+    action_index = {}
+    init = compiled.encode(problem.init)
+    states = {}
+    queue = deque([init])
+    seen = {init}
+    while queue:
+        state = queue.popleft()
+        if state & goal_pos == goal_pos and not state & goal_neg:
+            states[state] = (-1, ())
+            continue
+        rule = table.lookup(state)
+        action = None
+        if rule is not None and not isinstance(rule[4], str):
+            action = next((a for a in rule[4] if a.applicable(state)), None)
+        if action is None:
+            raise ValueError(f"Policy has no applicable action in reachable state {' '.join(compiled.decode(state))}")
+        if action.name not in action_index:
+            action_index[action.name] = len(actions)
+            actions.append(action.name)
+        successors = tuple(action.successors(state))
+        states[state] = (action_index[action.name], successors)
+        for succ in successors:
+            if succ not in seen:
+                seen.add(succ)
+                queue.append(succ)
+    bit_names = sorted(compiled.bits, key=compiled.bits.get)
+    return CompiledPolicy(bit_names, actions, [origins.get(a.lower()) for a in actions], init, states)
+
+def distinguishing(succ, successors):
+    # Bits set in every other outcome
+    common = -1
+    for other in successors:
+        if other != succ:
+            common &= other
+    return common
+
+class PolicyExecutor:
+    # Drives any number of process instances from one compiled policy. An
+    # instance is just its current state; the engine reports which element
+    # ran (or, after a choice, which element received the token) and gets
+    # the next element to run back.
+
+    def __init__(self, compiled):
+        self.compiled = compiled
+        self.table = compiled.table
+        # (state, element that became active) -> successor, to tell apart the
+        # outcomes of one nondeterministic action. A predicate only one outcome
+        # sets decides it; any other predicate picks the smallest outcome that
+        # sets it (the token went there and nowhere else).
+        self.branch = {}
+        for state, (_, successors) in self.table.items():
+            if len(successors) > 1:
+                for succ in successors:
+                    for p in self.bits(succ & ~distinguishing(succ, successors)):
+                        self.branch[(state, p)] = succ
+                for succ in sorted(successors, key=lambda t: (bin(t).count("1"), t)):
+                    for p in self.bits(succ):
+                        self.branch.setdefault((state, p), succ)
+        self.instances = {}
+
+    def bits(self, mask):
+        names = []
+        while mask:
+            low = mask & -mask
+            names.append(self.compiled.predicates[low.bit_length() - 1])
+            mask ^= low
+        return names
+
+    def action_of(self, state):
+        entry = self.table.get(state)
+        if entry is None or entry[0] < 0:
+            return None
+        return self.compiled.actions[entry[0]]
+
+    def start(self, instance):
+        self.instances[instance] = self.compiled.init
+        return self.action_of(self.compiled.init)
+
+    def next_action(self, instance):
+        return self.action_of(self.instances[instance])
+
+    def advance(self, instance, element=None):
+        # The prescribed action ran. element names the element that received
+        # the token (a list of them after an inclusive split) and is only
+        # needed when the action has several outcomes.
+        state = self.instances[instance]
+        _, successors = self.table[state]
+        if len(successors) == 1:
+            succ = successors[0]
+        else:
+            succ = None
+            if isinstance(element, str):
+                succ = self.branch.get((state, sanitize_name(element)))
+            elif element:
+                succ = self.resolve(successors, [sanitize_name(e) for e in element])
+            if succ is None:
+                raise KeyError(f"Instance {instance}: outcome of {self.action_of(state)} is ambiguous without a matching element (got {element!r})")
+        self.instances[instance] = succ
+        return self.action_of(succ)
+
+    def resolve(self, successors, predicates):
+        # Smallest outcome that sets all of the given predicates
+        mask = 0
+        for i, p in enumerate(self.compiled.predicates):
+            if p in predicates:
+                mask |= 1 << i
+        matches = [t for t in successors if t & mask == mask]
+        return min(matches, key=lambda t: (bin(t).count("1"), t)) if mask and matches else None
+
+    def finished(self, instance):
+        entry = self.table.get(self.instances[instance])
+        return entry is not None and entry[0] < 0
+
+    def finish(self, instance):
+        del self.instances[instance]
+
+def benchmark(executor, instances, seed=None):
+    # Interleaves that many instances, resolving each choice at random, and
+    # returns (calls, seconds spent inside the executor)
+    rng = random.Random(seed)
+    for i in range(instances):
+        executor.start(i)
+    live = list(range(instances))
+    calls = 0
+    spent = 0.0
+    while live:
+        i = live.pop(rng.randrange(len(live)))
+        state = executor.instances[i]
+        successors = executor.table[state][1]
+        element = None
+        if len(successors) > 1:
+            succ = rng.choice(successors)
+            element = next((p for p in executor.bits(succ) if executor.branch[(state, p)] == succ), None)
+            if element is None:
+                element = executor.bits(succ & ~state)
+        started = time.perf_counter()
+        executor.advance(i, element)
+        done = executor.finished(i)
+        spent += time.perf_counter() - started
+        calls += 1
+        if done:
+            executor.finish(i)
+        else:
+            live.append(i)
+    return calls, spent
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Compile a policy.out into a state -> action table and measure next-action latency.")
+    arg_parser.add_argument("inputs", nargs="+", help="policy.out files or generated <name>/not_flattened folders")
+    arg_parser.add_argument("--domain", default=None, help="domain PDDL (default: the one next to the policy)")
+    arg_parser.add_argument("--bpmn", default=None, help="diagram to take domain, problems and predicate table from")
+    arg_parser.add_argument("--problem", default=None, help="problem the policy was planned for (default: p01)")
+    arg_parser.add_argument("-o", "--output", default=None, help="compiled file (default: <policy>.compiled.json)")
+    arg_parser.add_argument("--bench", type=int, default=0, metavar="N", help="drive N concurrent simulated instances and report latency")
+    arg_parser.add_argument("--seed", type=int, default=None)
+    args = arg_parser.parse_args(argv)
+
+    policies = [found for path in args.inputs for found in find_policies(path)]
+    if not policies:
+        print("No policy.out found in the given inputs", file=sys.stderr)
+        return 2
+    if args.output and len(policies) > 1:
+        arg_parser.error(f"-o/--output names one file but {len(policies)} policies were found")
+
+    result = translate(args.bpmn) if args.bpmn else None
+    exit_code = 0
+    for policy_path, problem_name in policies:
+        domain, problem_name, problem = load_task(policy_path, args.problem or problem_name, args.domain, args.bpmn)
+        try:
+            compiled = compile_policy(load_policy(policy_path), domain, problem,
+                                      result.predicates if result else None, result.action_origins if result else None)
+        except ValueError as exc:
+            exit_code = 1
+            print(f"{policy_path} ({problem_name}): FAILED {exc}")
+            continue
+        output = args.output or os.path.splitext(policy_path)[0] + COMPILED_SUFFIX
+        compiled.save(output)
+        print(f"{policy_path} ({problem_name}): {len(compiled.table)} states, {len(compiled.actions)} actions, "
+              f"{len(compiled.predicates)} predicates -> {output}")
+        if args.bench:
+            calls, spent = benchmark(PolicyExecutor(CompiledPolicy.load(output)), args.bench, args.seed)
+            print(f"  {args.bench} instances, {calls} steps: {spent / calls * 1e6:.2f} us per step")
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
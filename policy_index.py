@@ -0,0 +1,293 @@
+import argparse
+import codecs
+import json
+import re
+import sys
+from array import array
+
+# Streaming reader for PRP's policy.out. The file is tokenized chunk by chunk
+# and folded straight into flat arrays, so a policy never exists as nested
+# dicts: node -> action id, node -> (first successor, count) into shared
+# successor arrays, and interned action, outcome, state and atom names.
+
+CHUNK_SIZE = 1 << 20
+NO_ACTION = "---"
+
+FLAG_GOAL = 1
+FLAG_SC = 2
+FLAG_RELEVANT = 4
+
+WHITESPACE_RE = re.compile(r"\s*")
+
+class JSONStreamReader:
+    # Pulls one JSON value at a time out of a stream. Containers we want to
+    # walk (the node and state maps) are entered token by token; everything
+    # inside them is decoded by json's C scanner, one entry at a time, so only
+    # a single policy node is ever held as Python objects.
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        # Drop what was consumed and append the next chunk; False at EOF
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if isinstance(chunk, bytes):
+            chunk = self.decoder.decode(chunk, final=not chunk)
+        self.eof = not chunk
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        while True:
+            self.pos = WHITESPACE_RE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON")
+
+    def consume(self, char):
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.consume(char):
+            raise ValueError(f"Expected {char!r} at {self.buffer[self.pos:self.pos + 40]!r}")
+
+    def value(self):
+        # One complete value. A parse that fails or stops at the very end of
+        # the buffer may be cut short by the chunk boundary, so read on.
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buffer, self.pos)
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def key(self):
+        key = self.value()
+        self.expect(":")
+        return key
+
+    def keys(self):
+        # Keys of the map that starts here; the caller reads each value
+        self.expect("{")
+        while not self.consume("}"):
+            yield self.key()
+            self.consume(",")
+
+    def elements(self):
+        self.expect("[")
+        while not self.consume("]"):
+            yield self.value()
+            self.consume(",")
+
+class Interner:
+    def __init__(self):
+        self.names = []
+        self.index = {}
+
+    def __call__(self, name):
+        i = self.index.get(name)
+        if i is None:
+            i = self.index[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def __len__(self):
+        return len(self.names)
+
+class CompactPolicy:
+    def __init__(self):
+        self.nodes = Interner()         # policy node ids ("0", "1", ...)
+        self.actions = Interner()
+        self.outcomes = Interner()
+        self.states = Interner()        # state ids ("0x3116e4a0")
+        self.atoms = Interner()
+        self.init = -1
+        self.goal = -1
+        self.node_action = array("i")   # action index, -1 for the goal node
+        self.node_state = array("i")
+        self.distance = array("i")
+        self.expected = array("i")      # expected successor node, -1 if none
+        self.flags = array("B")
+        self.succ_start = array("i")
+        self.succ_count = array("i")
+        self.succ_target = array("i")
+        self.succ_outcome = array("i")
+        self.state_start = array("i")   # per state index, into state_atoms
+        self.state_count = array("i")
+        self.state_atoms = array("i")   # atom index + 1, negated atoms negative
+        self.action_start = array("i")  # nodes grouped by action, built at the end
+        self.action_nodes = array("i")
+
+    def node(self, node_id):
+        i = self.nodes(node_id)
+        while len(self.node_action) <= i:
+            for table in (self.node_action, self.node_state, self.distance, self.expected):
+                table.append(-1)
+            self.flags.append(0)
+            self.succ_start.append(0)
+            self.succ_count.append(0)
+        return i
+
+    def finish(self):
+        # Counting sort of nodes by action: nodes_using() is then one slice
+        counts = [0] * (len(self.actions) + 1)
+        for a in self.node_action:
+            if a >= 0:
+                counts[a + 1] += 1
+        for a in range(len(self.actions)):
+            counts[a + 1] += counts[a]
+        self.action_start = array("i", counts)
+        fill = list(counts[:-1])
+        nodes = [0] * counts[-1]
+        for n, a in enumerate(self.node_action):
+            if a >= 0:
+                nodes[fill[a]] = n
+                fill[a] += 1
+        self.action_nodes = array("i", nodes)
+
+    # Lookups by policy node id (string) or action name
+
+    def next_action(self, node_id):
+        a = self.node_action[self.nodes.index[node_id]]
+        return self.actions.names[a] if a >= 0 else None
+
+    def successors(self, node_id):
+        n = self.nodes.index[node_id]
+        start = self.succ_start[n]
+        return [(self.outcomes.names[self.succ_outcome[k]], self.nodes.names[self.succ_target[k]])
+                for k in range(start, start + self.succ_count[n])]
+
+    def nodes_using(self, action):
+        a = self.actions.index.get(action)
+        if a is None:
+            return []
+        return [self.nodes.names[n] for n in self.action_nodes[self.action_start[a]:self.action_start[a + 1]]]
+
+    def is_strong_cyclic(self, node_id):
+        return bool(self.flags[self.nodes.index[node_id]] & FLAG_SC)
+
+    def is_goal(self, node_id):
+        return bool(self.flags[self.nodes.index[node_id]] & FLAG_GOAL)
+
+    def state_of(self, node_id):
+        # [(atom name, holds)] for the node's partial state, if states were loaded
+        s = self.node_state[self.nodes.index[node_id]]
+        if s < 0 or s >= len(self.state_start):
+            return []
+        start = self.state_start[s]
+        return [(self.atoms.names[abs(a) - 1], a > 0) for a in self.state_atoms[start:start + self.state_count[s]]]
+
+    @property
+    def all_strong_cyclic(self):
+        return all(f & FLAG_SC for f in self.flags)
+
+    def __len__(self):
+        return len(self.nodes)
+
+ATOM_RE = re.compile(r"(Negated)?Atom ([^(]*)\(")
+
+def load_policy(source, load_states=True, chunk_size=CHUNK_SIZE):
+    # source is a path or a text/binary stream
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return load_policy(f, load_states, chunk_size)
+
+    policy = CompactPolicy()
+    reader = JSONStreamReader(source, chunk_size)
+    for section in reader.keys():
+        if section == "nodes":
+            for node_id in reader.keys():
+                add_node(policy, node_id, reader.value())
+        elif section == "states" and load_states:
+            for state_id in reader.keys():
+                add_state(policy, state_id, reader.value())
+        elif section in ("edges", "states"):
+            # Redundant with the successor lists (or not wanted); skipped entry
+            # by entry so a large section is never materialized
+            if reader.peek() == "[":
+                for _ in reader.elements():
+                    pass
+            else:
+                for _ in reader.keys():
+                    reader.value()
+        else:
+            value = reader.value()
+            if section == "init":
+                policy.init = policy.node(value)
+            elif section == "goal":
+                policy.goal = policy.node(value)
+    policy.finish()
+    return policy
+
+def add_node(policy, node_id, node):
+    n = policy.node(node_id)
+    action = node.get("action", NO_ACTION)
+    policy.node_action[n] = policy.actions(action) if action != NO_ACTION else -1
+    if "state" in node:
+        policy.node_state[n] = policy.states(node["state"])
+    policy.distance[n] = int(node.get("distance", -1))
+    expected = node.get("expected_successor")
+    policy.expected[n] = policy.node(expected) if isinstance(expected, str) else -1
+    policy.flags[n] = ((FLAG_GOAL if node.get("is_goal") else 0)
+                       | (FLAG_SC if node.get("is_sc") else 0)
+                       | (FLAG_RELEVANT if node.get("is_relevant") else 0))
+    policy.succ_start[n] = len(policy.succ_target)
+    policy.succ_count[n] = len(node.get("successors", ()))
+    for successor in node.get("successors", ()):
+        policy.succ_outcome.append(policy.outcomes(successor["outcome_label"]))
+        policy.succ_target.append(policy.node(successor["successor_id"]))
+
+def add_state(policy, state_id, literals):
+    s = policy.states(state_id)
+    while len(policy.state_start) <= s:
+        policy.state_start.append(0)
+        policy.state_count.append(0)
+    policy.state_start[s] = len(policy.state_atoms)
+    for literal in literals:
+        match = ATOM_RE.match(literal)
+        if match:
+            atom = policy.atoms(match.group(2)) + 1
+            policy.state_atoms.append(-atom if match.group(1) else atom)
+            policy.state_count[s] += 1
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Load a PRP policy.out into compact indexed tables and query it.")
+    arg_parser.add_argument("policy")
+    arg_parser.add_argument("--node", action="append", default=[], help="print the action and successors of this policy node")
+    arg_parser.add_argument("--action", action="append", default=[], help="print the nodes that use this action")
+    arg_parser.add_argument("--no-states", action="store_true", help="skip the state table")
+    args = arg_parser.parse_args(argv)
+
+    policy = load_policy(args.policy, load_states=not args.no_states)
+    print(f"{args.policy}: {len(policy)} nodes, {len(policy.actions)} actions, "
+          f"{len(policy.succ_target)} successor edges, {len(policy.states)} states; "
+          f"init {policy.nodes.names[policy.init]}, goal {policy.nodes.names[policy.goal]}; "
+          f"{'strong cyclic' if policy.all_strong_cyclic else 'NOT strong cyclic everywhere'}")
+    for node_id in args.node:
+        print(f"  node {node_id}: {policy.next_action(node_id) or '(goal)'}")
+        for outcome, target in policy.successors(node_id):
+            print(f"    {outcome} -> {target}")
+    for action in args.action:
+        print(f"  {action}: {' '.join(policy.nodes_using(action)) or '(unused)'}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
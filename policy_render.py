@@ -0,0 +1,293 @@
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+from collections import deque
+
+from policy_index import FLAG_GOAL, load_policy
+from reachability import strongly_connected_components
+from read_bpmn_tasks_v2 import translate
+
+# Renders a policy.out as DOT in the same shape prpviz produces (one node per
+# policy node labelled with its action, goal doublecircle, init box), with
+# optional simplifications applied to the compact policy tables.
+
+TRUNCATED = -1      # stand-in node for everything cut off by --max-nodes
+
+class PolicyGraph:
+    def __init__(self, policy):
+        self.policy = policy
+        n = len(policy)
+        self.members = {i: [i] for i in range(n)}     # drawn node -> policy nodes
+        self.labels = {i: [policy.node_action[i]] for i in range(n)}  # action ids, top to bottom
+        self.succ = {i: set() for i in range(n)}
+        for i in range(n):
+            start = policy.succ_start[i]
+            for k in range(start, start + policy.succ_count[i]):
+                self.succ[i].add(policy.succ_target[k])
+        self.init = policy.init
+        self.goals = {i for i in range(n) if policy.flags[i] & FLAG_GOAL}
+
+    def predecessors(self):
+        preds = {i: set() for i in self.succ}
+        for i, targets in self.succ.items():
+            for t in targets:
+                preds.setdefault(t, set()).add(i)
+        return preds
+
+    def hide_goal_edges(self):
+        # Drop edges into goal nodes and the goal nodes themselves
+        for i in self.goals:
+            self.succ.pop(i, None)
+            self.labels.pop(i, None)
+            self.members.pop(i, None)
+        for targets in self.succ.values():
+            targets -= self.goals
+        self.goals = set()
+
+    def merge_equivalent(self):
+        # Nodes are equivalent when they run the same action and their
+        # successors fall into the same classes (bisimulation)
+        block = coarsest_partition(self.succ, lambda i: (tuple(self.labels[i]), i in self.goals))
+
+        representative = {}
+        for i in sorted(self.succ, key=lambda i: (i != self.init, i)):
+            representative.setdefault(block[i], i)
+        rep = {i: representative[block[i]] for i in self.succ}
+        members = {}
+        for i in self.succ:
+            members.setdefault(rep[i], []).extend(self.members[i])
+        self.succ = {r: {rep[t] for t in self.succ[r]} for r in members}
+        self.labels = {r: self.labels[r] for r in members}
+        self.members = members
+        self.goals = {rep[g] for g in self.goals}
+        self.init = rep.get(self.init, self.init)
+
+    def collapse_chains(self):
+        # Fold u -> v into one node when u has only v as successor and v has
+        # only u as predecessor; the labels are stacked in execution order
+        preds = self.predecessors()
+        for u in sorted(self.succ):
+            if u not in self.succ:
+                continue
+            while len(self.succ[u]) == 1:
+                (v,) = self.succ[u]
+                if v == u or v == self.init or v in self.goals or u in self.goals or len(preds.get(v, ())) != 1:
+                    break
+                self.labels[u] = self.labels[u] + self.labels.pop(v)
+                self.members[u].extend(self.members.pop(v))
+                self.succ[u] = self.succ.pop(v)
+                for t in self.succ[u]:
+                    preds[t].discard(v)
+                    preds[t].add(u)
+
+    def cap(self, max_nodes):
+        # Keep the first max_nodes nodes in breadth-first order from init;
+        # edges that leave the kept set point at one "truncated" node
+        if len(self.succ) <= max_nodes:
+            return False
+        keep = {self.init}
+        queue = deque([self.init])
+        while queue and len(keep) < max_nodes:
+            u = queue.popleft()
+            for t in sorted(self.succ.get(u, ())):
+                if t not in keep and len(keep) < max_nodes:
+                    keep.add(t)
+                    queue.append(t)
+        succ = {}
+        for u in keep:
+            succ[u] = {t if t in keep else TRUNCATED for t in self.succ[u]}
+        self.succ = succ
+        self.labels = {u: self.labels[u] for u in keep}
+        self.members = {u: self.members[u] for u in keep}
+        self.goals &= keep
+        return True
+
+def coarsest_partition(succ, key):
+    # {node: class id} for the coarsest partition that separates different
+    # key(node) and in which nodes of a class have successors in the same
+    # classes. Nodes that cannot reach a cycle get their class in one pass
+    # in reverse topological order, from their key and their successors'
+    # classes. The rest, which are never equivalent to those, are refined
+    # with Paige-Tarjan: O(E log V) instead of a full pass per round.
+    component = strongly_connected_components(list(succ), succ)
+    size = {}
+    for i in succ:
+        size[component[i]] = size.get(component[i], 0) + 1
+    cyclic = set()
+    block = {}
+    ids = {}
+    # Tarjan numbers components successors first
+    for i in sorted(succ, key=component.__getitem__):
+        if size[component[i]] > 1 or i in succ[i] or any(t in cyclic for t in succ[i]):
+            cyclic.add(i)
+        else:
+            block[i] = ids.setdefault((key(i), frozenset(block[t] for t in succ[i])), len(ids))
+    if not cyclic:
+        return block
+
+    # Initial classes of the cyclic part: the key, whether a node has a
+    # successor in the cyclic part, and the classes of its other successors,
+    # which are final
+    inner = {i: [t for t in succ[i] if t in cyclic] for i in cyclic}
+    preds = {i: [] for i in cyclic}
+    for i in cyclic:
+        for t in inner[i]:
+            preds[t].append(i)
+    members = {}
+    for i in cyclic:
+        outer = frozenset(block[t] for t in succ[i] if t not in cyclic)
+        members.setdefault((key(i), bool(inner[i]), outer), set()).add(i)
+    members = dict(enumerate(members.values()))
+    of = {i: b for b, nodes in members.items() for i in nodes}
+
+    # Compound classes group the blocks that still have to be used as
+    # splitters; count[(x, c)] is the number of successors of x in class c
+    compound = {0: set(members)}
+    compound_of = {b: 0 for b in members}
+    count = {(i, 0): len(inner[i]) for i in cyclic if inner[i]}
+    pending = [0] if len(members) > 1 else []
+
+    def split(marked):
+        for b, nodes in group(marked).items():
+            if len(nodes) == len(members[b]):
+                continue
+            new = len(members)
+            members[new] = nodes
+            members[b] -= nodes
+            for i in nodes:
+                of[i] = new
+            c = compound_of[b]
+            compound_of[new] = c
+            compound[c].add(new)
+            if len(compound[c]) == 2:
+                pending.append(c)
+
+    def group(nodes):
+        grouped = {}
+        for i in nodes:
+            grouped.setdefault(of[i], set()).add(i)
+        return grouped
+
+    while pending:
+        c = pending.pop()
+        if len(compound[c]) < 2:
+            continue
+        # Split off the smaller of two of its blocks as a class of its own
+        first, second = list(compound[c])[:2]
+        b = first if len(members[first]) <= len(members[second]) else second
+        compound[c].discard(b)
+        if len(compound[c]) > 1:
+            pending.append(c)
+        nb = len(compound)
+        compound[nb] = {b}
+        compound_of[b] = nb
+
+        into_b = {}
+        for y in members[b]:
+            for x in preds[y]:
+                into_b[x] = into_b.get(x, 0) + 1
+        # Three-way split: no successor in b, successors only in b (within
+        # c), successors both in b and in the rest of c
+        only_b = {x for x, n in into_b.items() if n == count[(x, c)]}
+        for x, n in into_b.items():
+            count[(x, nb)] = n
+            count[(x, c)] -= n
+        split(set(into_b))
+        split(only_b)
+
+    for b, nodes in members.items():
+        for i in nodes:
+            block[i] = len(ids) + b
+    return block
+
+def action_labels(result):
+    # PRP lowercases action names; map them back to the BPMN elements they
+    # were generated from, e.g. "inclusive_diverge_x" -> "Special handling?".
+    # Actions of unnamed elements (most gateways) keep their action name.
+    names = {e.id: e.name for e in result.elements if e.name}
+    labels = {}
+    for action, origins in result.action_origins.items():
+        if any(o in names for o in origins):
+            labels[action.lower()] = " / ".join(names.get(o, o) for o in origins)
+    return labels
+
+def label_for(action, policy, element_names):
+    if action < 0:
+        return "---"
+    name = policy.actions.names[action]
+    if element_names:
+        base = re.sub(r"(_detdup_\d+|_o\d+)$", "", name.lower())
+        return element_names.get(base, name)
+    return name
+
+def dot_escape(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+def to_dot(graph, element_names=None):
+    policy = graph.policy
+    lines = ["digraph {"]
+    for u in graph.succ:
+        label = "\\n".join(dot_escape(label_for(a, policy, element_names)) for a in graph.labels[u])
+        attrs = [f'label="{label}"']
+        if u in graph.goals:
+            attrs.append("shape=doublecircle")
+        elif u == graph.init:
+            attrs.append("shape=box")
+        if len(graph.members[u]) > 1:
+            attrs.append(f'tooltip="{len(graph.members[u])} policy nodes"')
+        lines.append(f"  {policy.nodes.names[u]} [{', '.join(attrs)}];")
+    if any(TRUNCATED in targets for targets in graph.succ.values()):
+        lines.append('  truncated [label="...", shape=plaintext];')
+    for u, targets in graph.succ.items():
+        for t in sorted(targets):
+            target = "truncated" if t == TRUNCATED else policy.nodes.names[t]
+            lines.append(f"  {policy.nodes.names[u]} -> {target};")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+def render(policy_path, bpmn=None, merge=False, collapse=False, hide_goal=False, max_nodes=None):
+    policy = load_policy(policy_path, load_states=False)
+    graph = PolicyGraph(policy)
+    if hide_goal:
+        graph.hide_goal_edges()
+    if merge:
+        graph.merge_equivalent()
+    if collapse:
+        graph.collapse_chains()
+    if max_nodes:
+        graph.cap(max_nodes)
+    element_names = action_labels(translate(bpmn)) if bpmn else None
+    return to_dot(graph, element_names), graph
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Render a PRP policy.out as a DOT graph (a built-in replacement for prpviz).")
+    arg_parser.add_argument("policy", help="policy.out")
+    arg_parser.add_argument("-o", "--output", default=None, help="DOT file to write (default: graph.dot next to the policy)")
+    arg_parser.add_argument("--bpmn", default=None, help="diagram the policy was planned for; labels nodes with BPMN element names")
+    arg_parser.add_argument("--merge", action="store_true", help="merge nodes with the same action and equivalent successors")
+    arg_parser.add_argument("--collapse-chains", action="store_true", help="fold linear chains into one node")
+    arg_parser.add_argument("--hide-goal", action="store_true", help="drop goal nodes and the edges into them")
+    arg_parser.add_argument("--max-nodes", type=int, default=None, help="keep at most this many nodes, breadth-first from init")
+    arg_parser.add_argument("--png", action="store_true", help="also run Graphviz dot to produce graph.png")
+    args = arg_parser.parse_args(argv)
+
+    dot, graph = render(args.policy, args.bpmn, args.merge, args.collapse_chains, args.hide_goal, args.max_nodes)
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(args.policy)), "graph.dot")
+    with open(output, "w") as f:
+        f.write(dot)
+    print(f"{args.policy}: {len(graph.policy)} policy nodes -> {len(graph.succ)} drawn -> {output}")
+
+    if args.png:
+        if shutil.which("dot") is None:
+            print("Graphviz 'dot' not found; skipping graph.png", file=sys.stderr)
+            return 1
+        png = os.path.splitext(output)[0] + ".png"
+        subprocess.run(["dot", "-Tpng", output, "-o", png], check=True)
+        print(f"  -> {png}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
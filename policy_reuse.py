@@ -0,0 +1,162 @@
+import argparse
+import os
+import re
+import sys
+
+from pddl_model import Problem, parse_domain, parse_problem
+from policy_index import FLAG_GOAL, load_policy
+from policy_verify import DEAD_END, PolicyTable, verify_policy
+from read_bpmn_tasks_v2 import translate
+from state_explorer import CompiledDomain
+
+# Carries a policy over to a regenerated domain after a diagram edit. Action
+# names come from element names and change when a task is renamed, but the
+# predicates in the policy's partial states are element ids and stay put, so
+# old actions are mapped to new ones through element ids. The mapped policy
+# is then verified against the new domain: if it is still strong cyclic the
+# planner need not run again, otherwise the states where it breaks are the
+# only ones that need a new plan.
+
+MAPPED_BY_ORIGIN = "origin"     # old diagram given: same element id
+MAPPED_BY_NAME = "name"         # action name unchanged
+MAPPED_BY_STATE = "state"       # the only new action the old nodes' states enable
+
+def lowered(mapping):
+    return {k.lower(): v for k, v in mapping.items()}
+
+def required_atoms(policy, compiled):
+    # {old action: mask of domain bits true in every node that chose it}
+    bits = {pred.lower(): bit for pred, bit in compiled.bits.items()}
+    required = {}
+    for n in range(len(policy)):
+        a = policy.node_action[n]
+        s = policy.node_state[n]
+        if a < 0 or policy.flags[n] & FLAG_GOAL or not 0 <= s < len(policy.state_start):
+            continue
+        mask = 0
+        start = policy.state_start[s]
+        for literal in policy.state_atoms[start:start + policy.state_count[s]]:
+            bit = bits.get(policy.atoms.names[literal - 1]) if literal > 0 else None
+            if bit is not None:
+                mask |= 1 << bit
+        name = re.sub(r"_detdup_\d+$", "", policy.actions.names[a])
+        required[name] = required.get(name, mask) & mask
+    return required
+
+def map_actions(policy, compiled, new_origins, old_origins=None):
+    # ({old action: [new action names]}, {old action: how it was mapped})
+    new_names = {a.name.lower(): a.name for a in compiled.actions}
+    by_element = {}
+    for action, origins in new_origins.items():
+        for element in origins:
+            by_element.setdefault(element, []).append(action)
+    old_origins = lowered(old_origins) if old_origins else {}
+
+    action_map = {}
+    how = {}
+    for old, required in required_atoms(policy, compiled).items():
+        if old in old_origins:
+            new = [a for element in old_origins[old] for a in by_element.get(element, [])]
+            if new:
+                action_map[old], how[old] = new, MAPPED_BY_ORIGIN
+            continue
+        if old in new_names:
+            action_map[old], how[old] = [new_names[old]], MAPPED_BY_NAME
+            continue
+        # The translator gives element X's action the precondition (X), so
+        # a new action whose preconditions the old nodes always satisfied
+        # is the renamed one; accepted only when it is unambiguous
+        candidates = [a.name for a in compiled.actions if a.pos and not a.pos & ~required]
+        elements = {tuple(new_origins.get(a, [a])) for a in candidates}
+        if candidates and len(elements) == 1:
+            action_map[old], how[old] = candidates, MAPPED_BY_STATE
+    return action_map, how
+
+class ReuseReport:
+    def __init__(self, verification, action_map, how, unmapped):
+        self.verification = verification
+        self.action_map = action_map
+        self.how = how
+        self.unmapped = unmapped
+
+    @property
+    def reusable(self):
+        return self.verification.strong_cyclic
+
+    @property
+    def broken_states(self):
+        # Where the old policy has no valid move; states that merely lead
+        # there (goal-unreachable) are covered by re-planning these
+        return [state for status, state, _ in self.verification.failures if status != DEAD_END]
+
+    @property
+    def affected_states(self):
+        return [state for status, state, _ in self.verification.failures if status == DEAD_END]
+
+def check_reuse(policy, domain_text, problem_text, new_origins, old_origins=None, max_states=None):
+    compiled = CompiledDomain(parse_domain(domain_text))
+    problem = parse_problem(problem_text)
+    action_map, how = map_actions(policy, compiled, new_origins, old_origins)
+    unmapped = sorted(set(required_atoms(policy, compiled)) - set(action_map))
+    table = PolicyTable(policy, compiled, action_map)
+    verification = verify_policy(compiled, table, compiled.encode(problem.init), problem.goal, max_states, stop_at_first=False)
+    return compiled, problem, ReuseReport(verification, action_map, how, unmapped)
+
+def write_replan_problems(compiled, problem, states, directory):
+    # One problem per broken state, starting there with the original goal
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for k, state in enumerate(states, 1):
+        replan = Problem(f"{problem.name}-replan-{k}", problem.domain_name, problem.objects,
+                         frozenset(compiled.decode(state)), problem.goal)
+        path = os.path.join(directory, f"replan_{k}.pddl")
+        with open(path, "w") as f:
+            f.write(replan.to_pddl())
+        paths.append(path)
+    return paths
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Check whether the policy planned for a previous version of a diagram still solves the regenerated domain.")
+    arg_parser.add_argument("policy", help="policy.out planned for the previous version")
+    arg_parser.add_argument("file", help="edited BPMN diagram")
+    arg_parser.add_argument("--previous", default=None, help="previous version of the diagram, to map actions by element id")
+    arg_parser.add_argument("--problem", default="p01", help="generated problem the policy was planned for")
+    arg_parser.add_argument("--replan-dir", default=None, help="write one problem per broken state here")
+    arg_parser.add_argument("--max-states", type=int, default=None)
+    arg_parser.add_argument("--show", type=int, default=3, help="number of broken states to print")
+    args = arg_parser.parse_args(argv)
+
+    result = translate(args.file)
+    if args.problem not in result.problems:
+        print(f"{args.file} has no problem {args.problem}", file=sys.stderr)
+        return 2
+    old_origins = translate(args.previous).action_origins if args.previous else None
+    policy = load_policy(args.policy)
+    compiled, problem, report = check_reuse(policy, result.domain, result.problems[args.problem],
+                                            result.action_origins, old_origins, args.max_states)
+
+    counts = {}
+    for method in report.how.values():
+        counts[method] = counts.get(method, 0) + 1
+    print(f"{args.policy} -> {args.file} ({args.problem}): {len(report.action_map)} actions mapped "
+          f"{counts}, {len(report.unmapped)} unmapped{': ' + ' '.join(report.unmapped) if report.unmapped else ''}")
+    verification = report.verification
+    if report.reusable:
+        print(f"  still strong cyclic ({verification.states} states); no re-planning needed")
+        return 0
+    broken = report.broken_states
+    print(f"  NOT reusable: {len(broken)} broken states, {len(report.affected_states)} more can no longer reach the goal "
+          f"({verification.states} states explored)")
+    shown = 0
+    for status, state, detail in verification.failures:
+        if status == DEAD_END or shown >= args.show:
+            continue
+        shown += 1
+        print(f"  {status}{' (' + detail + ')' if detail else ''}: {' '.join(compiled.decode(state))}")
+    if args.replan_dir:
+        paths = write_replan_problems(compiled, problem, broken, args.replan_dir)
+        print(f"  wrote {len(paths)} re-planning problems to {args.replan_dir}")
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+import argparse
+import glob
+import os
+import re
+import sys
+from collections import deque
+
+from pddl_model import parse_domain, parse_problem
+from policy_index import FLAG_GOAL, load_policy
+from read_bpmn_tasks_v2 import translate
+from state_explorer import CompiledDomain
+
+# Re-checks a PRP policy.out against a domain without running the planner.
+# The policy is executed on concrete states from the problem's init: in each
+# state the matching policy node with the lowest distance picks the action
+# (as PRP's policy lookup does), every oneof outcome is followed, and the
+# policy is strong cyclic if it never gets stuck and the goal stays
+# reachable from every state it can reach.
+
+OK = "ok"
+NO_MATCH = "no-matching-node"
+UNKNOWN_ACTION = "unknown-action"
+NOT_APPLICABLE = "not-applicable"
+DEAD_END = "goal-unreachable"
+TOO_LARGE = "state-limit"
+
+class PolicyTable:
+    # Policy nodes compiled against the domain's bit layout. PRP lowercases
+    # every name, so predicates and actions are matched case-insensitively.
+    # action_map ({policy action: [domain action names]}) translates actions
+    # of a policy planned for an earlier version of the domain.
+
+    def __init__(self, policy, compiled, action_map=None):
+        bits = {pred.lower(): bit for pred, bit in compiled.bits.items()}
+        actions = {a.name.lower(): a for a in compiled.actions}
+        if action_map is not None:
+            actions = {old: tuple(actions[n.lower()] for n in new if n.lower() in actions)
+                       for old, new in action_map.items()}
+        else:
+            actions = {name: (a,) for name, a in actions.items()}
+        self.policy = policy
+        self.unknown_atoms = set()
+        self.unknown_actions = set()
+        self.rules = []                 # (distance, node, pos, neg, action or name)
+        by_bit = {}
+        unanchored = []
+        for n in range(len(policy)):
+            a = policy.node_action[n]
+            if a < 0 or policy.flags[n] & FLAG_GOAL:
+                continue
+            name = re.sub(r"_detdup_\d+$", "", policy.actions.names[a])
+            action = actions.get(name)
+            if not action:
+                self.unknown_actions.add(name)
+            pos = neg = 0
+            matchable = True
+            s = policy.node_state[n]
+            start = policy.state_start[s] if 0 <= s < len(policy.state_start) else 0
+            count = policy.state_count[s] if 0 <= s < len(policy.state_start) else 0
+            for literal in policy.state_atoms[start:start + count]:
+                atom = policy.atoms.names[abs(literal) - 1]
+                bit = bits.get(atom)
+                if bit is None:
+                    # Predicates the domain lacks are always false
+                    self.unknown_atoms.add(atom)
+                    matchable &= literal < 0
+                elif literal > 0:
+                    pos |= 1 << bit
+                else:
+                    neg |= 1 << bit
+            if not matchable:
+                continue
+            rule = (policy.distance[n], n, pos, neg, action or name)
+            self.rules.append(rule)
+            # Index by one required bit, so a state only tests rules whose
+            # anchor bit it has
+            if pos:
+                by_bit.setdefault(pos.bit_length() - 1, []).append(rule)
+            else:
+                unanchored.append(rule)
+        self.by_bit = by_bit
+        self.unanchored = unanchored
+
+    def lookup(self, state):
+        best = None
+        candidates = [self.unanchored]
+        s = state
+        while s:
+            low = s & -s
+            bucket = self.by_bit.get(low.bit_length() - 1)
+            if bucket:
+                candidates.append(bucket)
+            s ^= low
+        for bucket in candidates:
+            for rule in bucket:
+                if state & rule[2] == rule[2] and not state & rule[3] and (best is None or rule[:2] < best[:2]):
+                    best = rule
+        return best
+
+class Verification:
+    def __init__(self, status, states, transitions, counterexample=None, path=None, detail=""):
+        self.status = status
+        self.states = states
+        self.transitions = transitions
+        self.counterexample = counterexample    # concrete state (int)
+        self.path = path or []                  # actions from init to it
+        self.detail = detail
+        self.failures = []                      # [(status, state, detail)], all of them
+
+    @property
+    def strong_cyclic(self):
+        return self.status == OK
+
+def verify_policy(compiled, table, init, goal, max_states=None, stop_at_first=True):
+    # With stop_at_first=False, states where the policy fails are recorded
+    # and treated as dead ends, and exploration goes on past them
+    goal_pos, goal_neg = compiled.literals(goal)
+    failures = []
+    parent = {init: None}
+    successors = {}
+    goal_states = set()
+    queue = deque([init])
+
+    def path_to(state):
+        path = []
+        while parent[state] is not None:
+            state, action = parent[state]
+            path.append(action)
+        return path[::-1]
+
+    def result():
+        transitions = sum(len(s) for s in successors.values())
+        if not failures:
+            return Verification(OK, len(parent), transitions)
+        status, state, detail = failures[0]
+        verification = Verification(status, len(parent), transitions, state, path_to(state), detail)
+        verification.failures = failures
+        return verification
+
+    while queue:
+        state = queue.popleft()
+        successors[state] = ()
+        if state & goal_pos == goal_pos and not state & goal_neg:
+            goal_states.add(state)
+            continue
+        failed = len(failures)
+        rule = table.lookup(state)
+        if rule is None:
+            failures.append((NO_MATCH, state, ""))
+        else:
+            node = table.policy.nodes.names[rule[1]]
+            actions = rule[4]
+            if isinstance(actions, str):
+                failures.append((UNKNOWN_ACTION, state, f"node {node} uses {actions}"))
+            else:
+                action = next((a for a in actions if a.applicable(state)), None)
+                if action is None:
+                    failures.append((NOT_APPLICABLE, state, f"node {node} chose {actions[0].name}"))
+        if len(failures) > failed:
+            if stop_at_first:
+                return result()
+            continue
+        nxt = successors[state] = action.successors(state)
+        for succ in nxt:
+            if succ not in parent:
+                parent[succ] = (state, action.name)
+                queue.append(succ)
+        if max_states is not None and len(parent) > max_states:
+            failures.append((TOO_LARGE, state, f"more than {max_states} states"))
+            return result()
+
+    # Every reached state must still be able to reach the goal
+    predecessors = {}
+    for state, nxt in successors.items():
+        for succ in nxt:
+            predecessors.setdefault(succ, []).append(state)
+    alive = set(goal_states)
+    queue = deque(alive)
+    while queue:
+        state = queue.popleft()
+        for prev in predecessors.get(state, ()):
+            if prev not in alive:
+                alive.add(prev)
+                queue.append(prev)
+    broken = {state for _, state, _ in failures}
+    for state in successors:            # breadth-first order: shortest path first
+        if state not in alive and state not in broken:
+            failures.append((DEAD_END, state, ""))
+            if stop_at_first:
+                break
+    return result()
+
+def find_policies(path):
+    # [(policy.out, problem name or None)] for a policy file or a generated
+    # folder; policies under runs/<problem>/ belong to that problem
+    if os.path.isfile(path):
+        workdir = os.path.dirname(os.path.abspath(path))
+        if os.path.basename(os.path.dirname(workdir)) == "runs":
+            return [(path, os.path.basename(workdir))]
+        return [(path, None)]
+    nested = os.path.join(path, "not_flattened")
+    folder = nested if os.path.isdir(nested) else path
+    found = []
+    if os.path.exists(os.path.join(folder, "policy.out")):
+        found.append((os.path.join(folder, "policy.out"), None))
+    for policy_path in sorted(glob.glob(os.path.join(folder, "runs", "*", "policy.out"))):
+        found.append((policy_path, os.path.basename(os.path.dirname(policy_path))))
+    return found
+
+def generated_folder(policy_path):
+    folder = os.path.dirname(os.path.abspath(policy_path))
+    if os.path.basename(os.path.dirname(folder)) == "runs":
+        folder = os.path.dirname(os.path.dirname(folder))
+    return folder
+
+def load_task(policy_path, problem_name, domain_path=None, bpmn=None):
+    # (domain text, {problem name: text}) the policy is checked against. A
+    # policy stored beside the problems, as prpviz leaves it, is taken to be
+    # for the first problem with a start event (p01).
+    if bpmn:
+        result = translate(bpmn)
+        domain, problems = result.domain, dict(result.problems)
+    else:
+        folder = generated_folder(policy_path)
+        domains = sorted(glob.glob(os.path.join(folder, "*_domain_no_flatten.pddl")))
+        if domain_path is None and not domains:
+            raise FileNotFoundError(f"No *_domain_no_flatten.pddl next to {policy_path}")
+        with open(domain_path or domains[0]) as f:
+            domain = f.read()
+        problems = {}
+        for p in sorted(glob.glob(os.path.join(folder, "p0*.pddl")), key=lambda p: (len(p), p)):
+            with open(p) as f:
+                problems[os.path.basename(p)[:-5]] = f.read()
+    if domain_path and bpmn:
+        with open(domain_path) as f:
+            domain = f.read()
+    if problem_name is None:
+        problem_name = next((p for p in problems if p != "p0"), "p0")
+    if problem_name not in problems:
+        raise FileNotFoundError(f"No problem {problem_name} for {policy_path}")
+    return domain, problem_name, problems[problem_name]
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Check that an existing policy.out is still a strong cyclic solution of the generated domain.")
+    arg_parser.add_argument("inputs", nargs="+", help="policy.out files or generated <name>/not_flattened folders")
+    arg_parser.add_argument("--domain", default=None, help="domain PDDL to check against (default: the one next to the policy)")
+    arg_parser.add_argument("--bpmn", default=None, help="regenerate domain and problems from this diagram instead")
+    arg_parser.add_argument("--problem", default=None, help="problem name, e.g. p01 (default: from runs/<problem>/ or the first with a start event)")
+    arg_parser.add_argument("--max-states", type=int, default=None)
+    args = arg_parser.parse_args(argv)
+
+    exit_code = 0
+    checked = 0
+    for path in args.inputs:
+        for policy_path, problem_name in find_policies(path):
+            domain, problem_name, problem_text = load_task(policy_path, args.problem or problem_name, args.domain, args.bpmn)
+            compiled = CompiledDomain(parse_domain(domain))
+            problem = parse_problem(problem_text)
+            table = PolicyTable(load_policy(policy_path), compiled)
+            result = verify_policy(compiled, table, compiled.encode(problem.init), problem.goal, args.max_states)
+            checked += 1
+            if result.strong_cyclic:
+                print(f"{policy_path} ({problem_name}): strong cyclic, {result.states} states, {result.transitions} transitions")
+            else:
+                exit_code = 1
+                detail = f" ({result.detail})" if result.detail else ""
+                print(f"{policy_path} ({problem_name}): FAILED {result.status}{detail} after {result.states} states")
+                print(f"  path: {' -> '.join(result.path) or '(initial state)'}")
+                print(f"  state: {' '.join(compiled.decode(result.counterexample))}")
+            if table.unknown_actions or table.unknown_atoms:
+                print(f"  policy mentions {len(table.unknown_actions)} actions and {len(table.unknown_atoms)} predicates "
+                      f"the domain does not have: {' '.join(sorted(table.unknown_actions | table.unknown_atoms)[:8])}")
+    if not checked:
+        print("No policy.out found in the given inputs", file=sys.stderr)
+        return 2
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import argparse
+import copy
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from goal_slicing import slice_domain
+from read_bpmn_tasks_v2 import BPMNParser, TranslationResult, bpmn_stem, sanitize_name, start_action
+from sese_fragments import split_action_blocks
+
+# Splits a collaboration into one module per participant process. Each pool's
+# actions are generated in a separate worker from a copy of the model that
+# holds only that pool plus the message flows it takes part in, and are then
+# cut down to the pool's own elements. Message flows are the coordination
+# layer: the sender's action sets the receiver's predicate, so predicates
+# shared between modules are the channels. Assembling the modules with one
+# start action for the whole diagram gives the same actions as the flat
+# translation.
+
+COORDINATION_FILE = "coordination.json"
+
+class Part:
+    def __init__(self, part_id, name, process, members, lanes):
+        self.id = part_id
+        self.name = name
+        self.process = process
+        self.members = members          # element ids
+        self.lanes = lanes              # lane names
+
+def partition(parser):
+    # [Part] per participant process, in document order; a process without a
+    # pool (a plain single-process diagram) is a part of its own. Elements
+    # merged as duplicates belong to the part holding the element kept.
+    processes = {}
+    for process in parser.root.findall('.//bpmn:process', parser.namespaces):
+        processes[process.get('id')] = {
+            e.get('id') for e in process.iter() if e.get('id') and e.get('id') not in parser.id_mapping
+        }
+    parts = []
+    for pool in parser.get_elements_by_type('Pool'):
+        if pool.processRef in processes:
+            parts.append(Part(pool.id, pool.name, pool.processRef, processes.pop(pool.processRef), []))
+    for process_id, members in processes.items():
+        parts.append(Part(process_id, None, process_id, members, []))
+    for lane in parser.get_elements_by_type('Lane'):
+        for part in parts:
+            if lane.id in part.members:
+                part.lanes.append(lane.name or lane.id)
+    return parts
+
+def part_parser(parser, part):
+    # Detached copy of the model for one part: its own elements, the message
+    # flows it takes part in, the far ends of those and of its sequence flows
+    # (elements of other parts it was merged with), and the elements right
+    # after the far ends, since the generator looks one element past a
+    # target. Only the element model travels to the worker, not the XML tree.
+    def get_merged_id(element_id):
+        return parser.id_mapping.get(element_id, element_id)
+
+    context = set(part.members)
+    far_ends = set()
+    for flow in parser.get_elements_by_type('Message Flow') + parser.get_elements_by_type('Sequence Flow'):
+        ends = {get_merged_id(flow.sourceRef), get_merged_id(flow.targetRef)}
+        if flow.id in part.members or ends & part.members:
+            context.add(flow.id)
+            far_ends |= ends - part.members
+    context |= far_ends
+    for flow in parser.get_elements_by_type('Sequence Flow'):
+        if get_merged_id(flow.sourceRef) in far_ends:
+            context.update((flow.id, get_merged_id(flow.targetRef)))
+
+    sub = copy.copy(parser)
+    sub.file_path = sub.tree = sub.root = None
+    sub.elements = [e for e in parser.elements if e.id in context]
+    return sub
+
+def generate_module(sub, part_id, members, module_name):
+    # Runs inside a worker: the part's actions and the predicates they use
+    domain, _, action_origins = sub.generate_pddl_domain_with_origins(module_name)
+    module, predicates, kept = slice_domain(domain, action_origins, members, module_name)
+    start_events = [e.id for e in sub.get_process_start_events() if e.id in members]
+    problems = sub.generate_problem_texts(start_events, predicates, module_name)
+    return part_id, TranslationResult(module_name, module, problems, predicates, sub.elements, start_events, kept)
+
+def generate_modules(parser, parts, domain_name, workers=None):
+    # {part id: TranslationResult}, in part order
+    jobs = [(part_parser(parser, part), part.id, part.members, f"{domain_name}-{sanitize_name(part.id)}") for part in parts]
+    if workers == 1 or len(jobs) < 2:
+        results = dict(generate_module(*job) for job in jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = dict(pool.map(generate_module, *zip(*jobs)))
+    return {part.id: results[part.id] for part in parts}
+
+def coordination(parser, parts, modules):
+    # The layer between modules: message flows between parts, and which
+    # parts mention each predicate that more than one of them uses
+    owner = {}
+    for part in parts:
+        for member in part.members:
+            owner[member] = part.id
+    flows = []
+    for flow in parser.get_elements_by_type('Message Flow'):
+        source = parser.id_mapping.get(flow.sourceRef, flow.sourceRef)
+        target = parser.id_mapping.get(flow.targetRef, flow.targetRef)
+        flows.append({
+            "id": flow.id,
+            "name": flow.name,
+            "source": source,
+            "target": target,
+            "from": owner.get(source, source),
+            "to": owner.get(target, target),
+        })
+    users = {}
+    for part_id, module in modules.items():
+        for pred in module.predicates:
+            users.setdefault(pred, []).append(part_id)
+    start_events = parser.get_process_start_events()
+    return {
+        "start_action": start_action(start_events)[0] if start_events else None,
+        "start_events": [e.id for e in start_events],
+        "message_flows": flows,
+        "shared_predicates": {pred: parts for pred, parts in sorted(users.items()) if len(parts) > 1},
+    }
+
+def assemble(parser, modules, domain_name):
+    # One domain from the modules: their own start actions are replaced by
+    # the diagram's, and clashing action names get the generator's _2, _3...
+    start_events = parser.get_process_start_events()
+    start_ids = [e.id for e in start_events]
+    used = {}
+    origins = {}
+    actions = []
+    if start_events:
+        name, text = start_action(start_events)
+        used[name] = 1
+        origins[name] = start_ids
+        actions.append(text)
+    for module in modules.values():
+        blocks = split_action_blocks(module.domain)
+        for name, block in blocks.items():
+            module_origins = module.action_origins.get(name, [])
+            if module_origins and set(module_origins) <= set(start_ids):
+                continue
+            unique = name
+            while unique in used:
+                used[name] = used.get(name, 1) + 1
+                unique = f"{name}_{used[name]}"
+            used[unique] = 1
+            origins[unique] = module_origins
+            actions.append(f"  {block.replace(f'(:action {name}', f'(:action {unique}', 1)}\n\n")
+
+    predicates = sorted({p for module in modules.values() for p in module.predicates})
+    domain = f"(define (domain {domain_name})\n"
+    domain += "  (:requirements :strips :typing)\n"
+    domain += "  (:types task event gateway)\n\n"
+    domain += "  (:predicates\n"
+    domain += "".join(f"    ({p})\n" for p in predicates)
+    domain += "    (done)\n"
+    domain += "    (started)\n"
+    domain += "  )\n\n"
+    domain += "".join(actions)
+    domain += ")"
+    problems = parser.generate_problem_texts(start_ids, predicates, domain_name)
+    return TranslationResult(domain_name, domain, problems, predicates, parser.elements, start_ids, origins)
+
+def action_differences(result, other):
+    # Element ids whose actions differ between two translations, comparing
+    # action bodies by origin so that names do not matter
+    def bodies(r):
+        blocks = split_action_blocks(r.domain)
+        by_origin = {}
+        for name, block in blocks.items():
+            key = tuple(sorted(r.action_origins.get(name, [name])))
+            by_origin.setdefault(key, []).append(block.split(None, 2)[2])
+        return {k: sorted(v) for k, v in by_origin.items()}
+    a, b = bodies(result), bodies(other)
+    return sorted(k for k in set(a) | set(b) if a.get(k) != b.get(k))
+
+def write_decomposition(parts, modules, layer, assembled, bpmn_filename, output_dir=None):
+    # <output_dir>/<name>/not_flattened/pools/<part>/{domain,p0,p01...}.pddl,
+    # pools/coordination.json and, when assembled, pools/assembled/
+    folder = os.path.join(output_dir or os.getcwd(), bpmn_filename, "not_flattened", "pools")
+    written = {}
+    results = [(sanitize_name(part.id), modules[part.id]) for part in parts]
+    if assembled is not None:
+        results.append(("assembled", assembled))
+    for sub_folder, result in results:
+        result_folder = os.path.join(folder, sub_folder)
+        os.makedirs(result_folder, exist_ok=True)
+        with open(os.path.join(result_folder, f"{bpmn_filename}_domain_no_flatten.pddl"), "w") as f:
+            f.write(result.domain)
+        for problem_name, content in result.problems.items():
+            with open(os.path.join(result_folder, f"{problem_name}.pddl"), "w") as f:
+                f.write(content)
+        written[sub_folder] = result_folder
+
+    manifest = dict(layer)
+    manifest["pools"] = {
+        part.id: {
+            "name": part.name,
+            "process": part.process,
+            "lanes": part.lanes,
+            "folder": written[sanitize_name(part.id)],
+            "actions": modules[part.id].action_count,
+            "predicates": len(modules[part.id].predicates),
+            "start_events": modules[part.id].start_events,
+        }
+        for part in parts
+    }
+    with open(os.path.join(folder, COORDINATION_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return written
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Translate each pool of a BPMN collaboration into its own PDDL module in parallel.")
+    arg_parser.add_argument("file")
+    arg_parser.add_argument("-o", "--output-dir", default=None)
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count; 1 runs in-process)")
+    arg_parser.add_argument("--assemble", action="store_true", help="also write the modules assembled into one domain")
+    arg_parser.add_argument("--check", action="store_true", help="compare the assembled actions with the flat translation and exit 1 if they differ")
+    args = arg_parser.parse_args(argv)
+
+    bpmn_filename = bpmn_stem(args.file)
+    parser = BPMNParser(args.file)
+    parser.parse()
+    parts = partition(parser)
+    modules = generate_modules(parser, parts, bpmn_filename, args.workers)
+    layer = coordination(parser, parts, modules)
+    assembled = assemble(parser, modules, bpmn_filename) if args.assemble or args.check else None
+    written = write_decomposition(parts, modules, layer, assembled if args.assemble else None, bpmn_filename, args.output_dir)
+
+    for part in parts:
+        module = modules[part.id]
+        lanes = f", lanes: {', '.join(part.lanes)}" if part.lanes else ""
+        print(f"{part.id} ({part.name or part.process}{lanes}): {module.action_count} actions, "
+              f"{len(module.predicates)} predicates -> {written[sanitize_name(part.id)]}")
+    print(f"{len(layer['message_flows'])} message flows, {len(layer['shared_predicates'])} shared predicates")
+    if args.check:
+        domain, _, origins = parser.generate_pddl_domain_with_origins(bpmn_filename)
+        flat = TranslationResult(bpmn_filename, domain, {}, [], parser.elements, [], origins)
+        differences = action_differences(assembled, flat)
+        if differences:
+            print(f"assembled domain differs from the flat translation for: {' '.join(' '.join(d) for d in differences)}")
+            return 1
+        print("assembled domain has the same actions as the flat translation")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:  # optional: fall back to Python ints as bit sets
+    np = None
+
+# Shared node-to-node reachability over a flow graph adjacency ({id: [ids]}).
+# Nodes get dense indices; edges are kept as two index arrays. Single and
+# multi-source searches are plain queue-based BFS over the adjacency, and the
+# transitive closure is one bit-packed row per strongly connected component,
+# filled sink-first so each row is the OR of its successors' rows.
+
+def strongly_connected_components(nodes, adjacency):
+    # Iterative Tarjan; returns {node: component index}. Components are
+    # numbered in reverse topological order (successors before predecessors).
+    index = {}
+    low = {}
+    on_stack = set()
+    stack = []
+    component = {}
+    counter = 0
+    n_components = 0
+
+    for root in nodes:
+        if root in index:
+            continue
+        work = [(root, iter(adjacency.get(root, [])))]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(adjacency.get(child, []))))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component[member] = n_components
+                    if member == node:
+                        break
+                n_components += 1
+    return component
+
+class ReachabilityIndex:
+    def __init__(self, adjacency, nodes=None):
+        order = list(nodes or [])
+        seen = set(order)
+        for src in sorted(adjacency):
+            for node in [src, *adjacency[src]]:
+                if node not in seen:
+                    seen.add(node)
+                    order.append(node)
+        self.nodes = order
+        self.index = {n: i for i, n in enumerate(order)}
+        self.adjacency = adjacency
+        edges = [(self.index[s], self.index[t]) for s in adjacency for t in adjacency[s]]
+        if np is not None:
+            self.src = np.array([e[0] for e in edges], dtype=np.int64)
+            self.dst = np.array([e[1] for e in edges], dtype=np.int64)
+        else:
+            self.src = [e[0] for e in edges]
+            self.dst = [e[1] for e in edges]
+        self._components = None
+        self._closure = None
+        self._reverse = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def reverse(self):
+        # Index over the reversed edges, for ancestor queries
+        if self._reverse is None:
+            incoming = {}
+            for s, targets in self.adjacency.items():
+                for t in targets:
+                    incoming.setdefault(t, []).append(s)
+            self._reverse = ReachabilityIndex(incoming, self.nodes)
+        return self._reverse
+
+    @property
+    def components(self):
+        if self._components is None:
+            self._components = strongly_connected_components(self.nodes, self.adjacency)
+        return self._components
+
+    def distances(self, sources, blocked=None):
+        # Multi-source BFS; returns {node: distance} like a plain BFS would.
+        # `blocked` is a node (or iterable of nodes) the search may not enter.
+        # A queue over the adjacency lists visits each edge once, whereas a
+        # whole-frontier array step would scan every edge per level.
+        if isinstance(blocked, str):
+            blocked = [blocked]
+        blocked = set(blocked or [])
+        dist = {s: 0 for s in sources if s in self.index and s not in blocked}
+        queue = deque(dist)
+        while queue:
+            node = queue.popleft()
+            level = dist[node] + 1
+            for t in self.adjacency.get(node, []):
+                if t not in dist and t not in blocked:
+                    dist[t] = level
+                    queue.append(t)
+        return dist
+
+    def reachable(self, sources, blocked=None):
+        # Set of node ids reachable from any of sources (sources included)
+        if blocked is None and self._closure is not None:
+            rows = [self.components[s] for s in sources if s in self.index]
+            return self._ids_of(self._or_rows(rows))
+        return set(self.distances(sources, blocked))
+
+    def closure(self):
+        # Bit-packed transitive closure; row c holds every node reachable
+        # from component c. Computed once, then shared by all queries.
+        if self._closure is not None:
+            return self._closure
+        comp = self.components
+        n_comp = max(comp.values(), default=-1) + 1
+        comp_of = [comp[n] for n in self.nodes]
+        comp_edges = sorted({(comp_of[s], comp_of[t]) for s, t in zip(self.src, self.dst) if comp_of[s] != comp_of[t]})
+
+        # Longest distance to a sink component; rows on one level only depend
+        # on rows of lower levels, so a whole level is OR-ed in one step
+        succ = {}
+        for c, d in comp_edges:
+            succ.setdefault(c, []).append(d)
+        level = [0] * n_comp
+        for c in range(n_comp):
+            level[c] = 1 + max((level[d] for d in succ.get(c, [])), default=-1)
+
+        if np is None:
+            rows = [0] * n_comp
+            for i, c in enumerate(comp_of):
+                rows[c] |= 1 << i
+            for c in sorted(range(n_comp), key=level.__getitem__):
+                for d in succ.get(c, []):
+                    rows[c] |= rows[d]
+            self._closure = rows
+            return rows
+
+        words = (len(self.nodes) + 63) // 64
+        rows = np.zeros((n_comp, max(words, 1)), dtype=np.uint64)
+        idx = np.arange(len(self.nodes))
+        comp_arr = np.array(comp_of, dtype=np.int64)
+        np.bitwise_or.at(rows, (comp_arr, idx // 64), np.left_shift(np.uint64(1), (idx % 64).astype(np.uint64)))
+        if comp_edges:
+            # Group edges by level, then by source, so each level is one
+            # reduceat over successor rows and one assignment per source row
+            edges = np.array(comp_edges, dtype=np.int64)
+            edge_level = np.array(level, dtype=np.int64)[edges[:, 0]]
+            order = np.lexsort((edges[:, 0], edge_level))
+            edges = edges[order]
+            bounds = np.searchsorted(edge_level[order], np.arange(1, max(level) + 2))
+            for lvl in range(max(level)):
+                batch = edges[bounds[lvl]:bounds[lvl + 1]]
+                if not len(batch):
+                    continue
+                sources, starts = np.unique(batch[:, 0], return_index=True)
+                rows[sources] |= np.bitwise_or.reduceat(rows[batch[:, 1]], starts, axis=0)
+        self._closure = rows
+        return rows
+
+    def _or_rows(self, rows):
+        closure = self.closure()
+        if np is None:
+            acc = 0
+            for r in rows:
+                acc |= closure[r]
+            return acc
+        if not rows:
+            return np.zeros(closure.shape[1], dtype=np.uint64)
+        return np.bitwise_or.reduce(closure[rows], axis=0)
+
+    def _ids_of(self, row):
+        if np is None:
+            return {n for i, n in enumerate(self.nodes) if row >> i & 1}
+        bits = np.unpackbits(row.view(np.uint8), bitorder="little")[:len(self.nodes)]
+        return {self.nodes[i] for i in np.nonzero(bits)[0]}
+
+    def mask(self, nodes):
+        # Bit row with the given nodes set, to restrict last_reachable_from_all
+        if np is None:
+            return sum(1 << self.index[n] for n in set(nodes) if n in self.index)
+        idx = np.array(sorted({self.index[n] for n in nodes if n in self.index}), dtype=np.int64)
+        row = np.zeros(self.closure().shape[1], dtype=np.uint64)
+        np.bitwise_or.at(row, idx // 64, np.left_shift(np.uint64(1), (idx % 64).astype(np.uint64)))
+        return row
+
+    def last_reachable_from_all(self, sources, among=None):
+        # The node with the highest index that every one of sources reaches
+        # (each source reaches itself), optionally only among the mask
+        # `among`; None if there is none. With nodes given in topological
+        # order this is the common descendant that comes last.
+        rows = [self.components[s] for s in sources if s in self.index]
+        if not rows:
+            return None
+        closure = self.closure()
+        if np is None:
+            acc = -1 if among is None else among
+            for r in rows:
+                acc &= closure[r]
+            return self.nodes[acc.bit_length() - 1] if acc > 0 else None
+        acc = np.bitwise_and.reduce(closure[rows], axis=0)
+        if among is not None:
+            acc &= among
+        words = np.nonzero(acc)[0]
+        if not len(words):
+            return None
+        w = int(words[-1])
+        return self.nodes[w * 64 + int(acc[w]).bit_length() - 1]
+
+    def descendants(self, node):
+        # Every node reachable from node, node itself included
+        return self._ids_of(self._or_rows([self.components[node]]))
+
+    def reaches(self, a, b):
+        row = self.closure()[self.components[a]]
+        i = self.index[b]
+        if np is None:
+            return bool(row >> i & 1)
+        return bool(int(row[i // 64]) >> (i % 64) & 1)
@@ -1,7 +1,25 @@
 import xml.etree.ElementTree as ET
+import copy
+import gzip
 import html
+import io
+import mmap
 import os
 import re
+from collections import deque
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Uncompressed diagrams at least this large are read through a memory map
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+
+# Elements flattening may add before it gives up
+DEFAULT_FLATTEN_BUDGET = 10000
 
 class BPMNElement:
     def __init__(self, element_type, element_id, name, **kwargs):
@@ -23,10 +41,95 @@ class BPMNElement:
                     info += f"\n  {attr}: {value}"
         return info
 
+def open_bpmn_source(file_path):
+    # Already-open binary streams are parsed as they are
+    if hasattr(file_path, 'read'):
+        return file_path
+
+    file_path = os.fspath(file_path)
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, 'rb')
+
+    if file_path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError("Reading .zst diagrams requires the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True)
+
+    f = open(file_path, 'rb')
+    size = os.fstat(f.fileno()).st_size
+    if size < MMAP_THRESHOLD:
+        return f
+    try:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+    return mapped
+
+def bpmn_stem(file_path):
+    # "orders/credit_scoring.bpmn.gz" -> "credit_scoring"
+    name = os.path.basename(file_path)
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return os.path.splitext(name)[0]
+
+class FlowGraph:
+    def __init__(self, elements, elements_by_id, incoming, outgoing):
+        self.elements = elements
+        self.elements_by_id = elements_by_id
+        self.incoming = incoming    # {target_id: [source_ids]}
+        self.outgoing = outgoing    # {source_id: [target_ids]}
+
+def allocate_join_slots(graph):
+    # Every converging parallel gateway gets one <gw>_precondition_<i> slot per
+    # distinct source, numbered in incoming order; a source with several flows
+    # into the join sets its one slot once. Returns ({gw_id: slot_count},
+    # {(source_id, gw_id): slot}) so emitters can look slots up without state.
+    slot_counts = {}
+    edge_slots = {}
+    for elem_id, elem in graph.elements_by_id.items():
+        sources = list(dict.fromkeys(graph.incoming.get(elem_id, [])))
+        if "Parallel Gateway" in elem.type and len(sources) > 1:
+            slot_counts[elem_id] = len(sources)
+            for i, src in enumerate(sources):
+                edge_slots[(src, elem_id)] = i
+    return slot_counts, edge_slots
+
+def sanitize_name(name):
+    # PDDL-safe predicate or action name for an element id or name
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def start_action(start_events):
+    # (action name, PDDL text) of the action that starts the process: one
+    # start event is simply entered, several are chosen among with oneof
+    if len(start_events) == 1:
+        start = start_events[0]
+        start_id = sanitize_name(start.id)
+        action_name = sanitize_name("start_" + (start.name or start.id))
+        text = f"  (:action {action_name}\n"
+        text += f"    :precondition (and (not (started))(not ({start_id})))\n"
+        text += f"    :effect (and ({start_id}) (started))\n"
+        text += "  )\n\n"
+        return action_name, text
+    start_preds = [sanitize_name(e.id) for e in start_events]
+    text = f"  (:action start_process\n"
+    text += f"    :precondition (and (not (started)) {' '.join(f'(not ({p}))' for p in start_preds)})\n"
+    text += f"    :effect (and (oneof {' '.join(f'({p})' for p in start_preds)}) (started))\n"
+    text += "  )\n\n"
+    return "start_process", text
+
 class BPMNParser:
     def __init__(self, file_path):
         self.file_path = file_path
-        self.tree = ET.parse(file_path)
+        # ET.parse feeds the expat parser in fixed-size chunks, so compressed
+        # and memory-mapped sources are never materialised as one big string
+        source = open_bpmn_source(file_path)
+        try:
+            self.tree = ET.parse(source)
+        finally:
+            if source is not file_path:
+                source.close()
         self.root = self.tree.getroot()
         self.namespaces = {'bpmn': 'http://www.omg.org/spec/BPMN/20100524/MODEL'}
         self.elements = []
@@ -179,45 +282,16 @@ class BPMNParser:
 
         self.elements = merged_elements
 
-    def generate_pddl_domain(self, domain_name="bpmn-generated"):
-        elements_by_id = {e.id: e for e in self.elements}
-        outgoing = {}
-        incoming = {}
-        predicates = set()
-        skipped_gateways = set()
-
-        def get_merged_id(element_id):
-            return self.id_mapping.get(element_id, element_id)
-
-        for flow in self.get_elements_by_type('Sequence Flow'):
-            src = get_merged_id(flow.sourceRef)
-            tgt = get_merged_id(flow.targetRef)
-            outgoing.setdefault(src, []).append(tgt)
-            incoming.setdefault(tgt, []).append(src)
-
-        def sanitize_name(name):
-            return re.sub(r'[^a-zA-Z0-9_]', '_', name)
-        
-        def is_valid_message_flow(source_elem, target_elem):
-            # Only allow Task → Event or Event → Task
-            if not source_elem or not target_elem:
-                return False
-
-            # One must be a task, the other must be an event
-            is_source_task = "Task" in source_elem.type
-            is_target_task = "Task" in target_elem.type
-            is_source_event = "Event" in source_elem.type
-            is_target_event = "Event" in target_elem.type
-
-            if is_source_task and is_target_event:
-                return True
-            if is_source_event and is_target_task:
-                return True
-
-            return False
+    def snapshot_elements(self):
+        # Private copy of the parsed model with message flows applied, so that
+        # generation never mutates self.elements. Start Events joined to a task
+        # by a message flow become Intermediate Catch Events, and every valid
+        # Task <-> Event message flow gets a synthetic sequence flow.
+        elements = [copy.copy(e) for e in self.elements]
+        elements_by_id = {e.id: e for e in elements}
 
         synthetic_sequence_flows = []
-        for e in self.elements:
+        for e in elements:
             if e.type != 'Message Flow':
                 continue
 
@@ -245,32 +319,238 @@ class BPMNParser:
                     )
                 )
 
-        # Now add ONLY these synthetic flows to self.elements and update incoming/outgoing:
-        self.elements.extend(synthetic_sequence_flows)
+        elements.extend(synthetic_sequence_flows)
+        return elements, elements_by_id, synthetic_sequence_flows
+
+    def get_process_start_events(self):
+        # Start events as generation sees them (message start events excluded)
+        elements, _, _ = self.snapshot_elements()
+        return [e for e in elements if e.type == "Start Event"]
+
+    def build_flow_graph(self):
+        # Snapshot plus the control-flow adjacency used by generation and the
+        # analysis passes: sequence flows with merged duplicate ids, then the
+        # synthetic Task <-> Event message flows
+        elements, elements_by_id, synthetic_sequence_flows = self.snapshot_elements()
+        outgoing = {}
+        incoming = {}
+
+        def get_merged_id(element_id):
+            return self.id_mapping.get(element_id, element_id)
+
+        synthetic_ids = {flow.id for flow in synthetic_sequence_flows}
+        for flow in elements:
+            if flow.type != 'Sequence Flow' or flow.id in synthetic_ids:
+                continue
+            src = get_merged_id(flow.sourceRef)
+            tgt = get_merged_id(flow.targetRef)
+            outgoing.setdefault(src, []).append(tgt)
+            incoming.setdefault(tgt, []).append(src)
 
         for flow in synthetic_sequence_flows:
             src = flow.sourceRef
             tgt = flow.targetRef
             outgoing.setdefault(src, []).append(tgt)
             incoming.setdefault(tgt, []).append(src)
-        
-        self.elements.extend(synthetic_sequence_flows)
 
-        parallel_converging_gateways = {}
+        return FlowGraph(elements, elements_by_id, incoming, outgoing)
+
+    def flatten_diagram(self, budget=DEFAULT_FLATTEN_BUDGET):
+        # Unrolls merges from the start events so that each copy of the part
+        # after a merge has a single way in, as graveyard/read_bpmn_tasks.py
+        # did. Copies are memoized by (node, context), the context being the
+        # merge flows taken so far, so the branches of a parallel block inside
+        # one copy still meet at one join and loops are unrolled once. A merge
+        # is only unrolled when every parallel/inclusive join after it is fed
+        # only from inside its copy and no message flow touches that part.
+        # Raises ValueError, leaving the model untouched, once more than
+        # `budget` elements would be added. Returns the number added.
+        elements_by_id = {e.id: e for e in self.elements}
 
-        for elem_id, elem in elements_by_id.items():
-            if (
-                "Parallel Gateway" in elem.type
-                and len(incoming.get(elem_id, [])) > 1
-            ):
-                parallel_converging_gateways[elem_id] = [0,len(incoming.get(elem_id, []))]
+        def get_merged_id(element_id):
+            return self.id_mapping.get(element_id, element_id)
+
+        flows = self.get_elements_by_type('Sequence Flow')
+        outgoing = {}
+        incoming = {}
+        for flow in flows:
+            outgoing.setdefault(get_merged_id(flow.sourceRef), []).append(flow)
+            incoming.setdefault(get_merged_id(flow.targetRef), []).append(get_merged_id(flow.sourceRef))
+        message_nodes = set()
+        for flow in self.get_elements_by_type('Message Flow'):
+            message_nodes.update((flow.sourceRef, flow.targetRef))
+        starts = [e.id for e in self.get_process_start_events()]
+        joins = {
+            node for node, sources in incoming.items()
+            if len(sources) > 1 and node in elements_by_id
+            and elements_by_id[node].type in ("Parallel Gateway", "Inclusive Gateway")
+        }
+
+        def reachable(sources, blocked=None):
+            seen = set(s for s in sources if s != blocked)
+            queue = deque(seen)
+            while queue:
+                node = queue.popleft()
+                for flow in outgoing.get(node, []):
+                    target = get_merged_id(flow.targetRef)
+                    if target != blocked and target not in seen:
+                        seen.add(target)
+                        queue.append(target)
+            return seen
+
+        unrollable = {}
+        def can_unroll(merge):
+            if merge not in unrollable:
+                after = reachable([merge])
+                dominated = after - reachable(starts, blocked=merge)
+                unrollable[merge] = not (after & message_nodes) and all(
+                    join in dominated and all(s in dominated or s == merge for s in incoming[join])
+                    for join in joins & after
+                )
+            return unrollable[merge]
+
+        memo = {}           # (node, context) -> copy id
+        taken = set()       # nodes whose first copy kept the original id
+        on_path = {}        # node -> copy ids on the current DFS path
+        copies = []         # (original id, copy id)
+        edges = []          # (original flow, source copy, target copy)
+        added = [0]
+
+        def grow():
+            added[0] += 1
+            if added[0] > budget:
+                raise ValueError(f"Flattening needs more than {budget} added elements; raise the budget or translate without flattening")
+
+        def copy_of(node, context):
+            key = (node, context)
+            if key in memo:
+                return memo[key], False
+            if node not in taken:
+                taken.add(node)
+                copy_id = node
+            else:
+                grow()
+                copy_id = f"{node}_dup{added[0]}"
+                copies.append((node, copy_id))
+            memo[key] = copy_id
+            return copy_id, True
+
+        # Iterative depth-first walk: long chains would exhaust the recursion limit
+        stack = []
+        for start in starts:
+            copy_id, new = copy_of(start, ())
+            if new:
+                stack.append((start, copy_id, (), iter(outgoing.get(start, []))))
+                on_path.setdefault(start, []).append(copy_id)
+            while stack:
+                node, copy_id, context, pending = stack[-1]
+                flow = next(pending, None)
+                if flow is None:
+                    stack.pop()
+                    on_path[node].pop()
+                    continue
+                target = get_merged_id(flow.targetRef)
+                if on_path.get(target):
+                    edges.append((flow, copy_id, on_path[target][-1]))     # loop back edge
+                    continue
+                merge = len(incoming.get(target, [])) > 1 and target not in joins
+                child_context = context + (flow.id,) if merge and can_unroll(target) else context
+                target_copy, new = copy_of(target, child_context)
+                edges.append((flow, copy_id, target_copy))
+                if new:
+                    stack.append((target, target_copy, child_context, iter(outgoing.get(target, []))))
+                    on_path.setdefault(target, []).append(target_copy)
+
+        # Rebuild the flows: an edge between original ids keeps its flow,
+        # every other edge gets a copy; flows out of nodes the walk never
+        # reached are kept as they are
+        visited = {node for node, _ in memo}
+        kept = set()
+        new_flows = []
+        for flow, source, target in edges:
+            if source == get_merged_id(flow.sourceRef) and target == get_merged_id(flow.targetRef) and flow.id not in kept:
+                kept.add(flow.id)
+                new_flows.append(flow)
+            else:
+                grow()
+                new_flows.append(BPMNElement(
+                    "Sequence Flow", f"{flow.id}_dup{added[0]}", flow.name, sourceRef=source, targetRef=target
+                ))
+        new_flows.extend(f for f in flows if get_merged_id(f.sourceRef) not in visited)
+
+        new_nodes = []
+        for node, copy_id in copies:
+            clone = copy.copy(elements_by_id[node])
+            clone.id = copy_id
+            new_nodes.append(clone)
+        copies_of = {}
+        for node, copy_id in copies:
+            copies_of.setdefault(node, []).append(copy_id)
+
+        elements = []
+        for e in self.elements:
+            if e.type == 'Sequence Flow':
+                continue
+            if e.type == 'Lane':
+                e = copy.copy(e)
+                e.flowNodeRefs = e.flowNodeRefs + [c for ref in e.flowNodeRefs for c in copies_of.get(ref, [])]
+            elements.append(e)
+        self.elements = elements + new_nodes + new_flows
+        return added[0]
+
+    def generate_pddl_domain(self, domain_name="bpmn-generated"):
+        domain, predicates, _ = self.generate_pddl_domain_with_origins(domain_name)
+        return domain, predicates
+
+    def generate_pddl_domain_with_origins(self, domain_name="bpmn-generated"):
+        # Same as generate_pddl_domain, plus {action_name: [element ids]}
+        # recording which BPMN elements each emitted action came from
+        graph = self.build_flow_graph()
+        elements = graph.elements
+        elements_by_id = graph.elements_by_id
+        outgoing = graph.outgoing
+        incoming = graph.incoming
+        predicates = set()
+        skipped_gateways = set()
+        action_origins = {}
+
+        def record_action(action_name, *element_ids):
+            action_origins.setdefault(action_name, []).extend(element_ids)
+
+        def get_elements_by_type(element_type):
+            return [e for e in elements if e.type == element_type]
+
+        def get_merged_id(element_id):
+            return self.id_mapping.get(element_id, element_id)
+
+        def is_valid_message_flow(source_elem, target_elem):
+            # Only allow Task → Event or Event → Task
+            if not source_elem or not target_elem:
+                return False
+
+            # One must be a task, the other must be an event
+            is_source_task = "Task" in source_elem.type
+            is_target_task = "Task" in target_elem.type
+            is_source_event = "Event" in source_elem.type
+            is_target_event = "Event" in target_elem.type
+
+            if is_source_task and is_target_event:
+                return True
+            if is_source_event and is_target_task:
+                return True
+
+            return False
+
+        # Join slots for converging parallel gateways are fixed up front, so the
+        # order in which actions are emitted below does not matter
+        parallel_converging_gateways, join_slots = allocate_join_slots(graph)
 
         domain = f"(define (domain {domain_name})\n"
         domain += "  (:requirements :strips :typing)\n"
         domain += "  (:types task event gateway)\n\n"
 
         domain += "  (:predicates\n"
-        for e in self.elements:
+        for e in elements:
             if "Event" in e.type or "Gateway" in e.type or "Task" in e.type:
                 pred = sanitize_name(e.id)
                 if pred not in predicates:
@@ -278,14 +558,14 @@ class BPMNParser:
                     predicates.add(pred)
 
             if e.type == "Exclusive Gateway":
-                for flow in self.get_elements_by_type("Sequence Flow"):
+                for flow in get_elements_by_type("Sequence Flow"):
                     if flow.sourceRef == e.id:
                         pred = sanitize_name(flow.targetRef)
                         if pred not in predicates:
                             domain += f"    ({pred})\n"
                             predicates.add(pred)
         
-        for e in self.elements:
+        for e in elements:
             if "Inclusive Gateway" in e.type:
                 gw_id = sanitize_name(e.id)
                 n_outgoing = len(outgoing.get(e.id, []))
@@ -312,8 +592,7 @@ class BPMNParser:
                         domain += f"    ({branch_pred})\n"
                         predicates.add(branch_pred)
 
-        for gw_id in parallel_converging_gateways.keys():
-            incoming_count = parallel_converging_gateways[gw_id][1]
+        for gw_id, incoming_count in parallel_converging_gateways.items():
             for i in range(incoming_count):
                 pred = f"({sanitize_name(gw_id)}_precondition_{i})"
                 domain += f"    {pred}\n"
@@ -323,23 +602,13 @@ class BPMNParser:
         domain += "    (started)\n"
         domain += "  )\n\n"
 
-        start_events = self.get_elements_by_type("Start Event")
-        if len(start_events) == 1:
-            start = start_events[0]
-            start_id = sanitize_name(start.id)
-            action_name = sanitize_name("start_" + (start.name or start.id))
-            domain += f"  (:action {action_name}\n"
-            domain += f"    :precondition (and (not (started))(not ({start_id})))\n"
-            domain += f"    :effect (and ({start_id}) (started))\n"
-            domain += "  )\n\n"
-        elif len(start_events) > 1:
-            start_preds = [sanitize_name(e.id) for e in start_events]
-            domain += f"  (:action start_process\n"
-            domain += f"    :precondition (and (not (started)) {' '.join(f'(not ({p}))' for p in start_preds)})\n"
-            domain += f"    :effect (and (oneof {' '.join(f'({p})' for p in start_preds)}) (started))\n"
-            domain += "  )\n\n"
+        start_events = get_elements_by_type("Start Event")
+        if start_events:
+            action_name, text = start_action(start_events)
+            record_action(action_name, *(e.id for e in start_events))
+            domain += text
 
-        for e in self.elements:
+        for e in elements:
             if "Gateway" in e.type:
                 inc = incoming.get(e.id, [])
                 if len(inc) == 1:
@@ -348,22 +617,18 @@ class BPMNParser:
                         start_id = sanitize_name(src_elem.id)
                         gateway_id = sanitize_name(e.id)
                         action_name = f"activate_{gateway_id}"
+                        record_action(action_name, e.id)
                         domain += f"  (:action {action_name}\n"
                         domain += f"    :precondition (and ({start_id}))\n"
                         domain += f"    :effect (and ({gateway_id}) (not({start_id})))\n"
                         domain += "  )\n\n"
         
-        def get_parallel_gateway_precondition_if_needed(element_id, outgoing, parallel_converging_gateways):
-            # Look at *all* outgoing edges from this element
+        def get_parallel_gateway_precondition_if_needed(element_id):
+            # Slot this element sets when it feeds a converging parallel gateway
             for target_id in outgoing.get(element_id, []):
-                if target_id in parallel_converging_gateways:
-                    counter, incoming_count = parallel_converging_gateways[target_id]
-                    if counter >= incoming_count:
-                        # Safety: don't exceed available counters
-                        return ""
-                    pred = f" ({sanitize_name(target_id)}_precondition_{counter})"
-                    parallel_converging_gateways[target_id][0] += 1
-                    return pred
+                slot = join_slots.get((element_id, target_id))
+                if slot is not None:
+                    return f" ({sanitize_name(target_id)}_precondition_{slot})"
             # If none of the outgoing edges go to a converging parallel gateway
             return ""
 
@@ -375,10 +640,10 @@ class BPMNParser:
             for start in start_events:
                 visited = set()
                 stack = []
-                queue = [start.id]
+                queue = deque([start.id])
 
                 while queue:
-                    current_id = queue.pop(0)
+                    current_id = queue.popleft()
                     if current_id in visited:
                         continue
                     visited.add(current_id)
@@ -439,7 +704,7 @@ class BPMNParser:
             return "\n".join(lines)
 
         converge_to_diverge = map_inclusive_gateway_pairs(
-            self.elements,
+            elements,
             incoming,
             outgoing,
             start_events,
@@ -447,13 +712,16 @@ class BPMNParser:
         )
 
         # Inclusive diverging gateway actions
-        for e in self.elements:
+        for e in elements:
             if "Inclusive Gateway" in e.type and len(incoming.get(e.id, [])) == 1 and len(outgoing.get(e.id, [])) > 1:
                 gw_id = sanitize_name(e.id)
                 num_branches = len(outgoing.get(e.id, []))
 
                 # Add the increase/decrease counter actions for this gateway
                 counter_actions = generate_inclusive_counter_actions(gw_id, num_branches)
+                record_action(f"inclusive_increase_{gw_id}", e.id)
+                record_action(f"inclusive_decrease_{gw_id}", e.id)
+                record_action(f"inclusive_diverge_{gw_id}", e.id)
                 domain += counter_actions
                 domain += "\n"
 
@@ -473,7 +741,7 @@ class BPMNParser:
                 domain += f"  )\n\n"
 
        # Inclusive converging gateway actions
-        for e in self.elements:
+        for e in elements:
             if "Inclusive Gateway" in e.type and len(incoming.get(e.id, [])) > 1:
                 gw_id = sanitize_name(e.id)
                 nexts = outgoing.get(e.id, [])
@@ -488,7 +756,8 @@ class BPMNParser:
                     # 1. The converging gateway itself active
                     # 2. At least one branch fired
                     # 3. The counter is 0
-                    pred = get_parallel_gateway_precondition_if_needed(e.id,outgoing, parallel_converging_gateways)
+                    pred = get_parallel_gateway_precondition_if_needed(e.id)
+                    record_action(f"inclusive_converge_{gw_id}", e.id)
                     domain += f"  (:action inclusive_converge_{gw_id}\n"
                     domain += f"    :precondition (and ({gw_id}) (at_least_one_branch_{diverge_gw_id}) (inclusive_counter_{diverge_gw_id}_0))\n"
                     domain += f"    :effect (and ({next_id}) (not ({gw_id})) (not (at_least_one_branch_{diverge_gw_id})){pred})\n"
@@ -555,11 +824,11 @@ class BPMNParser:
                 if len(branch_effects) == 1:
                     effects.append(next(iter(branch_effects)))  # only one predicate
                 else:
-                    effects.append(f"(and {' '.join(branch_effects)})")
+                    effects.append(f"(and {' '.join(sorted(branch_effects))})")
             return effects
 
         generated = set()
-        for e in self.elements:
+        for e in elements:
             if e.id in skipped_gateways or e.id in generated:
                 continue
 
@@ -581,12 +850,12 @@ class BPMNParser:
 
                 if "Parallel Gateway" in e.type:
                     # Parallel gateway — activate all downstream tasks
-                    pred = get_parallel_gateway_precondition_if_needed(e.id, outgoing, parallel_converging_gateways)
+                    pred = get_parallel_gateway_precondition_if_needed(e.id)
 
                     # Build preconditions for converging gateways
                     preconds = [f"({sanitize_name(e.id)})"]
                     if e.id in parallel_converging_gateways:
-                        incoming_count = parallel_converging_gateways[e.id][1]
+                        incoming_count = parallel_converging_gateways[e.id]
                         for i in range(incoming_count):
                             preconds.append(f"({sanitize_name(e.id)}_precondition_{i})")
                     else:
@@ -596,6 +865,7 @@ class BPMNParser:
                     # Build effects
                     effects = [f"({sanitize_name(tgt)})" for tgt in targets]
 
+                    record_action(action_name, e.id)
                     domain += f"  (:action {action_name}\n"
                     domain += f"    :precondition (and {' '.join(preconds)})\n"
                     domain += f"    :effect (and {' '.join(effects)} (not ({sanitize_name(e.id)})){pred})\n"
@@ -612,7 +882,7 @@ class BPMNParser:
 
                         # Check if the immediate successor of this target is a gateway
                         if "Event-Based Gateway" in e.type:
-                            next_flows = [flow for flow in self.get_elements_by_type("Sequence Flow") if flow.sourceRef == tgt]
+                            next_flows = [flow for flow in get_elements_by_type("Sequence Flow") if flow.sourceRef == tgt]
                             for flow in next_flows:
                                 next_elem = elements_by_id.get(flow.targetRef)
                                 if next_elem and "Gateway" in next_elem.type:
@@ -622,7 +892,8 @@ class BPMNParser:
                             oneof_effects.append(effect_predicates[0])
                         else:
                             oneof_effects.append(f"(and {' '.join(effect_predicates)})")
-                    pred = get_parallel_gateway_precondition_if_needed(e.id,outgoing, parallel_converging_gateways)
+                    pred = get_parallel_gateway_precondition_if_needed(e.id)
+                    record_action(action_name, e.id)
                     domain += f"  (:action {action_name}\n"
                     domain += f"    :precondition (and {precondition})\n"
                     domain += f"    :effect (and"
@@ -641,12 +912,14 @@ class BPMNParser:
                     # Fallback for other gateways
                     if len(targets) == 1:
                         effect = f"({sanitize_name(targets[0])})"
+                        record_action(action_name, e.id)
                         domain += f"  (:action {action_name}\n"
                         domain += f"    :precondition (and {precondition})\n"
                         domain += f"    :effect (and {effect} (not {precondition}){pred})\n"
                         domain += "  )\n\n"
                     elif len(targets) > 1:
                         effects = [f"({sanitize_name(tgt)})" for tgt in targets]
+                        record_action(action_name, e.id)
                         domain += f"  (:action {action_name}\n"
                         domain += f"    :precondition (and {precondition})\n"
                         domain += f"    :effect (and {' '.join(effects)} (not {precondition}){pred})\n"
@@ -720,9 +993,10 @@ class BPMNParser:
                             branch_marker = f"branch_started_{sanitize_name(src_elem.id + '_' + e.id)}"
                             branch_markers.add(branch_marker)
 
-                        pred = get_parallel_gateway_precondition_if_needed(e.id,outgoing, parallel_converging_gateways)
+                        pred = get_parallel_gateway_precondition_if_needed(e.id)
 
                         # Start writing the action
+                        record_action(action_name, e.id)
                         domain += f"  (:action {action_name}\n"
                         domain += f"    :precondition (and {' '.join(sorted(standard_preconditions))}"
                         for marker in sorted(branch_markers):
@@ -779,7 +1053,7 @@ class BPMNParser:
                     # Start with only the task itself as precondition
                     branch_preconditions = set()
                     branch_effects = set()
-                    pred = get_parallel_gateway_precondition_if_needed(e.id,outgoing, parallel_converging_gateways)
+                    pred = get_parallel_gateway_precondition_if_needed(e.id)
 
                     if has_control_gateway:
                         # After Exclusive/Parallel gateway: only the task itself as precondition
@@ -830,6 +1104,7 @@ class BPMNParser:
 
                     # ---------------------------------
                     # Write the action
+                    record_action(action_name, e.id)
                     domain += f"  (:action {action_name}\n"
                     extra_preconditions = set()
                     if inclusive_diverge_src:
@@ -882,23 +1157,24 @@ class BPMNParser:
                     domain += "  )\n\n"
 
         # End events
-        for end_event in self.get_elements_by_type("End Event"):
+        for end_event in get_elements_by_type("End Event"):
             end_id = sanitize_name(end_event.id)
             name = sanitize_name(end_event.name or end_event.id)
-            domain += f"  (:action goal_{name}\n"
+            action_name = get_unique_action_name(f"goal_{name}")
+            record_action(action_name, end_event.id)
+            domain += f"  (:action {action_name}\n"
             domain += f"    :precondition (and ({end_id}))\n"
             domain += f"    :effect (done)\n"
             domain += "  )\n\n"
 
         domain += ")"
-        return domain, sorted(predicates)
+        return domain, sorted(predicates), action_origins
     
-    def generate_problem_files(self, bpmn_filename, start_events, predicates, domain_name="domain_name"):
-        output_folder = os.path.join(os.getcwd(), bpmn_filename)
-        os.makedirs(output_folder, exist_ok=True)
-
-        not_flattened_folder = os.path.join(output_folder, "not_flattened")
-        os.makedirs(not_flattened_folder, exist_ok=True)
+    def generate_problem_texts(self, start_events, predicates, domain_name="domain_name", flattened=False):
+        # Returns {problem_name: pddl_text}, p0 first, without touching the disk.
+        # Problems of a flattened diagram are named like the old flattening
+        # script's, <name>-bpmn-flatten
+        suffix = "bpmn-flatten" if flattened else "bpmn-no-flatten"
 
         # Deduplicate predicates
         predicates = set(predicates)
@@ -932,8 +1208,8 @@ class BPMNParser:
         goal_state = "(and (done))"
 
         # Problem 0 (no start events initialized)
-        empty_init_path = os.path.join(not_flattened_folder, "p0.pddl")
-        p0_content = f"""(define (problem p0-bpmn-no-flatten)
+        problems = {}
+        problems["p0"] = f"""(define (problem p0-{suffix})
         (:domain {domain_name})
         (:objects
 {object_section.strip()}
@@ -943,16 +1219,12 @@ class BPMNParser:
         )
 """
 
-        with open(empty_init_path, 'w') as f:
-            f.write(p0_content)
-
         # Problem files for each start event
         for count, start_event in enumerate(start_events, 1):
             problem_name = f"p0{count}"
-            file_path = os.path.join(not_flattened_folder, f"{problem_name}.pddl")
 
             init_state = [f"({start_event})"] + [f"({c})" for c in initial_counters]
-            problem_content = f"""(define (problem {problem_name}-bpmn-no-flatten)
+            problems[problem_name] = f"""(define (problem {problem_name}-{suffix})
                     (:domain {domain_name})
                     (:objects
             {object_section.strip()}
@@ -961,13 +1233,115 @@ class BPMNParser:
                     (:goal {goal_state})
                     )
             """
+
+        return problems
+
+    def generate_problem_files(self, bpmn_filename, start_events, predicates, domain_name="domain_name", output_dir=None):
+        output_folder = os.path.join(output_dir or os.getcwd(), bpmn_filename)
+        os.makedirs(output_folder, exist_ok=True)
+
+        not_flattened_folder = os.path.join(output_folder, "not_flattened")
+        os.makedirs(not_flattened_folder, exist_ok=True)
+
+        problem_paths = []
+        for problem_name, content in self.generate_problem_texts(start_events, predicates, domain_name).items():
+            file_path = os.path.join(not_flattened_folder, f"{problem_name}.pddl")
             with open(file_path, 'w') as f:
-                f.write(problem_content)
+                f.write(content)
+            problem_paths.append(file_path)
+
+        return problem_paths
+
+class TranslationOptions:
+    def __init__(self, domain_name=None, flatten=False, flatten_budget=DEFAULT_FLATTEN_BUDGET):
+        # Defaults to the file stem for paths and "bpmn-generated" otherwise
+        self.domain_name = domain_name
+        self.flatten = flatten                  # unroll merges first (BPMNParser.flatten_diagram)
+        self.flatten_budget = flatten_budget
+
+class TranslationResult:
+    def __init__(self, domain_name, domain, problems, predicates, elements, start_events, action_origins=None, flattened=False):
+        self.domain_name = domain_name
+        self.domain = domain            # domain PDDL text
+        self.problems = problems        # {problem_name: problem PDDL text}, p0 first
+        self.predicates = predicates    # sorted predicate table
+        self.elements = elements        # parsed BPMNElement model
+        self.start_events = start_events
+        self.action_origins = action_origins or {}   # {action_name: [element ids]}
+        self.flattened = flattened
+
+    @property
+    def action_count(self):
+        return self.domain.count("(:action ")
+
+    def write(self, output_dir=None):
+        # Writes <output_dir>/<domain_name>/not_flattened/..., the same layout
+        # as the interactive run, and returns (domain_path, problem_paths).
+        # Flattened results go to <domain_name>/flattened/<domain_name>_domain.pddl
+        # with p01... next to it, the layout of the old flattening script.
+        if self.flattened:
+            folder = os.path.join(output_dir or os.getcwd(), self.domain_name, "flattened")
+            domain_file = f"{self.domain_name}_domain.pddl"
+        else:
+            folder = os.path.join(output_dir or os.getcwd(), self.domain_name, "not_flattened")
+            domain_file = f"{self.domain_name}_domain_no_flatten.pddl"
+        os.makedirs(folder, exist_ok=True)
+        domain_path = os.path.join(folder, domain_file)
+        with open(domain_path, "w") as f:
+            f.write(self.domain)
+
+        problem_paths = []
+        for problem_name, content in self.problems.items():
+            if self.flattened and problem_name == "p0":
+                continue
+            problem_path = os.path.join(folder, f"{problem_name}.pddl")
+            with open(problem_path, "w") as f:
+                f.write(content)
+            problem_paths.append(problem_path)
+        return domain_path, problem_paths
+
+def translate(source, options=None):
+    # source may be a path, an open binary stream, or the BPMN XML itself as
+    # bytes/str. Nothing is written to disk; use TranslationResult.write for that.
+    options = options or TranslationOptions()
+    domain_name = options.domain_name
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    elif isinstance(source, str) and source.lstrip().startswith("<"):
+        source = io.BytesIO(source.encode("utf-8"))
+    elif isinstance(source, (str, os.PathLike)):
+        source = os.fspath(source)
+        domain_name = domain_name or bpmn_stem(source)
+    domain_name = domain_name or "bpmn-generated"
+
+    parser = BPMNParser(source)
+    parser.parse()
+    if options.flatten:
+        parser.flatten_diagram(options.flatten_budget)
+    domain, predicates, action_origins = parser.generate_pddl_domain_with_origins(domain_name)
+    start_events = [e.id for e in parser.get_process_start_events()]
+    problems = parser.generate_problem_texts(start_events, predicates, domain_name, options.flatten)
+    return TranslationResult(domain_name, domain, problems, predicates, parser.elements, start_events, action_origins,
+                             flattened=options.flatten)
+
+def translate_file(file_path, output_dir=None, options=None):
+    # Parse one diagram and write its domain and problem files under
+    # <output_dir>/<name>/not_flattened (or flattened), the same layout as the
+    # interactive run
+    result = translate(file_path, options)
+    domain_path, problem_paths = result.write(output_dir)
+    return {
+        "domain_file": domain_path,
+        "problem_files": problem_paths,
+        "predicates": len(result.predicates),
+        "actions": result.action_count,
+    }
 
 if __name__ == '__main__':
     file_name = input("Enter file name (no path): ")
     file_path = f'bpmn_diagrams/{file_name}'
-    domain_name = file_path.split("/")[1][:-5]
+    domain_name = bpmn_stem(file_path)
     parser = BPMNParser(file_path)
     parser.parse()
 
@@ -978,7 +1352,7 @@ if __name__ == '__main__':
     pddl_domain, predicates = parser.generate_pddl_domain(domain_name)
 
     # Extract the BPMN file name (without extension)
-    bpmn_filename = os.path.splitext(os.path.basename(file_path))[0]
+    bpmn_filename = bpmn_stem(file_path)
 
     # Create a new folder in the current directory
     output_folder = os.path.join(os.getcwd(), bpmn_filename)
@@ -994,7 +1368,7 @@ if __name__ == '__main__':
     print(f"\nPDDL domain saved to {output_file_path}")
 
     # Identify start events
-    start_events = [e.id for e in parser.get_elements_by_type("Start Event")]
+    start_events = [e.id for e in parser.get_process_start_events()]
 
     # Call the new generate_problem_files method
     parser.generate_problem_files(bpmn_filename, start_events, predicates, domain_name)
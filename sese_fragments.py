@@ -0,0 +1,434 @@
+import argparse
+import hashlib
+import sys
+from collections import deque
+
+from read_bpmn_tasks_v2 import BPMNParser
+
+SOURCE = "__source__"
+SINK = "__sink__"
+FLOW_NODE_KINDS = ("Event", "Task", "Gateway")
+WL_ROUNDS = 3
+
+class Fragment:
+    # A single-entry/single-exit region of the flow graph. entry and exit are
+    # (source, target) edges; nodes excludes the virtual source and sink.
+    def __init__(self, entry, exit, nodes):
+        self.entry = entry
+        self.exit = exit
+        self.nodes = nodes
+        self.children = []
+        self.parent = None
+        self.structural_hash = None
+
+    @property
+    def is_trivial(self):
+        return len(self.nodes) == 1
+
+    def iter_fragments(self):
+        # Pre-order walk of this fragment and everything nested inside it
+        yield self
+        for child in self.children:
+            yield from child.iter_fragments()
+
+    def __str__(self):
+        return f"Fragment({self.entry[0]} -> ... -> {self.exit[1]}, {len(self.nodes)} nodes, {self.structural_hash[:12]})"
+
+def relevant_nodes(graph):
+    # Flow nodes that lie on some path from an entry node to an exit node
+    nodes = [e.id for e in graph.elements if any(k in e.type for k in FLOW_NODE_KINDS)]
+    node_set = set(nodes)
+    succ = {n: [t for t in graph.outgoing.get(n, []) if t in node_set] for n in nodes}
+    pred = {n: [s for s in graph.incoming.get(n, []) if s in node_set] for n in nodes}
+
+    def reach(roots, adjacency):
+        seen = set(roots)
+        queue = deque(roots)
+        while queue:
+            for nxt in adjacency[queue.popleft()]:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    queue.append(nxt)
+        return seen
+
+    entries = [n for n in nodes if not pred[n]]
+    exits = [n for n in nodes if not succ[n]]
+    keep = reach(entries, succ) & reach(exits, pred)
+    return [n for n in nodes if n in keep], succ
+
+def augmented_edges(graph):
+    # Edge list of the flow graph closed into one strongly connected graph:
+    # SOURCE feeds every entry node, every exit node feeds SINK, and a return
+    # edge SINK -> SOURCE (always the last edge) closes the loop
+    nodes, succ = relevant_nodes(graph)
+    node_set = set(nodes)
+    edges = []
+    has_pred = set()
+    for n in nodes:
+        targets = [t for t in succ[n] if t in node_set]
+        for t in targets:
+            edges.append((n, t))
+            has_pred.add(t)
+        if not targets:
+            edges.append((n, SINK))
+    for n in nodes:
+        if n not in has_pred:
+            edges.append((SOURCE, n))
+    edges.append((SINK, SOURCE))
+    return nodes, edges
+
+class Bracket:
+    # An entry of a bracket list: a backedge of the undirected DFS tree, or a
+    # capping backedge added by the algorithm (edge is None)
+    def __init__(self, edge):
+        self.edge = edge
+        self.prev = None
+        self.next = None
+        self.recent_size = -1
+        self.recent_class = None
+
+class BracketList:
+    # Doubly linked stack with O(1) push, delete, top and concatenation
+    def __init__(self):
+        self.top = None
+        self.bottom = None
+        self.size = 0
+
+    def push(self, bracket):
+        bracket.prev = None
+        bracket.next = self.top
+        if self.top is None:
+            self.bottom = bracket
+        else:
+            self.top.prev = bracket
+        self.top = bracket
+        self.size += 1
+
+    def delete(self, bracket):
+        if bracket.prev is None:
+            self.top = bracket.next
+        else:
+            bracket.prev.next = bracket.next
+        if bracket.next is None:
+            self.bottom = bracket.prev
+        else:
+            bracket.next.prev = bracket.prev
+        self.size -= 1
+
+    def concat(self, other):
+        if other.top is None:
+            return
+        if self.top is None:
+            self.top = other.top
+        else:
+            self.bottom.next = other.top
+            other.top.prev = self.bottom
+        self.bottom = other.bottom
+        self.size += other.size
+
+def cycle_equivalence_classes(edges):
+    # Two edges of a strongly connected graph are cycle equivalent exactly when
+    # they are crossed by the same brackets (backedges) of an undirected DFS
+    # tree. Linear time bracket lists after Johnson, Pearson & Pingali (1994).
+    adjacency = {}
+    for i, (u, v) in enumerate(edges):
+        if u != v:
+            adjacency.setdefault(u, []).append((v, i))
+            adjacency.setdefault(v, []).append((u, i))
+
+    edge_class = [None] * len(edges)
+    class_count = 0
+
+    def new_class():
+        nonlocal class_count
+        class_count += 1
+        return class_count
+
+    # A self-loop is only ever on its own cycle
+    for i, (u, v) in enumerate(edges):
+        if u == v:
+            edge_class[i] = new_class()
+
+    dfsnum = {}
+    by_dfsnum = []
+    parent_edge = {}
+    children = {}
+    backedges_up = {}    # node -> backedges to its ancestors
+    backedges_down = {}  # node -> backedges from its descendants
+    for root in adjacency:
+        if root in dfsnum:
+            continue
+        dfsnum[root] = len(by_dfsnum)
+        by_dfsnum.append(root)
+        parent_edge[root] = None
+        stack = [(root, iter(adjacency[root]))]
+        while stack:
+            node, it = stack[-1]
+            for nxt, i in it:
+                if i == parent_edge[node]:
+                    continue
+                if nxt not in dfsnum:
+                    dfsnum[nxt] = len(by_dfsnum)
+                    by_dfsnum.append(nxt)
+                    parent_edge[nxt] = i
+                    children.setdefault(node, []).append(nxt)
+                    stack.append((nxt, iter(adjacency[nxt])))
+                    break
+                if dfsnum[nxt] < dfsnum[node]:
+                    backedges_up.setdefault(node, []).append((nxt, i))
+                    backedges_down.setdefault(nxt, []).append(i)
+            else:
+                stack.pop()
+
+    brackets = {}
+    capping = {}
+    hi = {}
+    blist = {}
+    for node in reversed(by_dfsnum):
+        n = dfsnum[node]
+        hi0 = min((dfsnum[t] for t, _ in backedges_up.get(node, [])), default=n)
+        child_hi = sorted((hi[c], c) for c in children.get(node, []))
+        hi1 = child_hi[0][0] if child_hi else n
+        hi2 = child_hi[1][0] if len(child_hi) > 1 else n
+        hi[node] = min(hi0, hi1)
+
+        current = BracketList()
+        for child in children.get(node, []):
+            current.concat(blist.pop(child))
+        for bracket in capping.pop(node, []):
+            current.delete(bracket)
+        for i in backedges_down.get(node, []):
+            current.delete(brackets[i])
+            if edge_class[i] is None:
+                edge_class[i] = new_class()
+        for _, i in backedges_up.get(node, []):
+            brackets[i] = Bracket(i)
+            current.push(brackets[i])
+        if hi2 < hi0:
+            bracket = Bracket(None)
+            capping.setdefault(by_dfsnum[hi2], []).append(bracket)
+            current.push(bracket)
+        blist[node] = current
+
+        tree_edge = parent_edge[node]
+        if tree_edge is None:
+            continue
+        top = current.top
+        if top is None:
+            # A bridge; cannot happen in a strongly connected graph
+            edge_class[tree_edge] = new_class()
+            continue
+        if top.recent_size != current.size:
+            top.recent_size = current.size
+            top.recent_class = new_class()
+        edge_class[tree_edge] = top.recent_class
+        if top.recent_size == 1 and top.edge is not None:
+            edge_class[top.edge] = edge_class[tree_edge]
+
+    classes = {}
+    for i, c in enumerate(edge_class):
+        classes.setdefault(c, []).append(i)
+    return list(classes.values())
+
+def dominator_depths(edges):
+    # Dominator-tree depth of every edge, computed on the graph with each edge
+    # split by its own node (and the return edge left out)
+    succ = {}
+    for i, (u, v) in enumerate(edges[:-1]):
+        succ.setdefault(u, []).append(("edge", i))
+        succ.setdefault(("edge", i), []).append(v)
+
+    order = []
+    seen = {SOURCE}
+    stack = [(SOURCE, iter(succ.get(SOURCE, [])))]
+    while stack:
+        node, it = stack[-1]
+        for nxt in it:
+            if nxt not in seen:
+                seen.add(nxt)
+                stack.append((nxt, iter(succ.get(nxt, []))))
+                break
+        else:
+            order.append(node)
+            stack.pop()
+    order.reverse()
+    position = {n: i for i, n in enumerate(order)}
+    preds = {}
+    for node, targets in succ.items():
+        for t in targets:
+            preds.setdefault(t, []).append(node)
+
+    # Cooper, Harvey & Kennedy iterative dominators
+    idom = {SOURCE: SOURCE}
+    changed = True
+    while changed:
+        changed = False
+        for node in order[1:]:
+            new_idom = None
+            for p in preds.get(node, []):
+                if p not in idom:
+                    continue
+                if new_idom is None:
+                    new_idom = p
+                    continue
+                a, b = p, new_idom
+                while a != b:
+                    while position[a] > position[b]:
+                        a = idom[a]
+                    while position[b] > position[a]:
+                        b = idom[b]
+                new_idom = a
+            if idom.get(node) != new_idom:
+                idom[node] = new_idom
+                changed = True
+
+    depth = {SOURCE: 0}
+    for node in order[1:]:
+        depth[node] = depth[idom[node]] + 1
+    return {i: depth.get(("edge", i), 0) for i in range(len(edges) - 1)}
+
+def fragment_nodes(edges, succ_edges, entry, exit):
+    # Everything reachable from the entry edge without crossing the exit edge
+    start = edges[entry][1]
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        for i in succ_edges.get(node, []):
+            if i == exit or i == len(edges) - 1:
+                continue
+            nxt = edges[i][1]
+            if nxt not in seen:
+                seen.add(nxt)
+                queue.append(nxt)
+    seen.discard(SINK)
+    seen.discard(SOURCE)
+    return frozenset(seen)
+
+def decompose(graph):
+    # Canonical SESE fragments, nested into a tree whose root is the process
+    nodes, edges = augmented_edges(graph)
+    root = Fragment(edges[-1], edges[-1], frozenset(nodes))
+    if not nodes:
+        return root
+
+    depths = dominator_depths(edges)
+    succ_edges = {}
+    for i, (u, _) in enumerate(edges):
+        succ_edges.setdefault(u, []).append(i)
+
+    fragments = {root.nodes: root}
+    return_edge = len(edges) - 1
+    for cls in cycle_equivalence_classes(edges):
+        ordered = sorted((i for i in cls if i != return_edge), key=lambda i: depths[i])
+        for entry, exit in zip(ordered, ordered[1:]):
+            members = fragment_nodes(edges, succ_edges, entry, exit)
+            if members and members not in fragments:
+                fragments[members] = Fragment(edges[entry], edges[exit], members)
+
+    # Canonical fragments are nested or disjoint, so walking them smallest
+    # first, a fragment's children are the outermost fragments seen so far
+    # among its nodes
+    by_size = sorted(fragments.values(), key=lambda f: len(f.nodes))
+    innermost = {}
+    for fragment in by_size:
+        for node in fragment.nodes:
+            inner = innermost.get(node)
+            if inner is not None and inner.parent is None:
+                inner.parent = fragment
+                fragment.children.append(inner)
+            innermost[node] = fragment
+    for fragment in by_size:
+        fragment.children.sort(key=lambda f: (-len(f.nodes), sorted(f.nodes)))
+        assign_structural_hash(graph, fragment)
+    return root
+
+def node_label(graph, node_id):
+    if node_id in (SOURCE, SINK):
+        return node_id
+    elem = graph.elements_by_id.get(node_id)
+    return f"{elem.type}|{elem.name or ''}" if elem else "?"
+
+def assign_structural_hash(graph, fragment):
+    # Weisfeiler-Lehman style hash over types, names and shape; element ids do
+    # not contribute, so the same block in two diagrams hashes the same
+    members = fragment.nodes
+    labels = {n: node_label(graph, n) for n in members}
+    if fragment.entry[1] in labels:
+        labels[fragment.entry[1]] = "entry:" + labels[fragment.entry[1]]
+    if fragment.exit[0] in labels:
+        labels[fragment.exit[0]] = "exit:" + labels[fragment.exit[0]]
+
+    for _ in range(WL_ROUNDS):
+        labels = {
+            n: hashlib.sha1(repr((
+                labels[n],
+                sorted(labels[t] for t in graph.outgoing.get(n, []) if t in members),
+                sorted(labels[s] for s in graph.incoming.get(n, []) if s in members),
+            )).encode()).hexdigest()
+            for n in members
+        }
+
+    boundary = (node_label(graph, fragment.entry[0]), node_label(graph, fragment.exit[1]))
+    fragment.structural_hash = hashlib.sha1(repr((sorted(labels.values()), boundary)).encode()).hexdigest()
+
+def split_action_blocks(domain):
+    # {action_name: "(:action ...)"} in the order the generator emitted them
+    blocks = {}
+    pos = domain.find("(:action ")
+    while pos != -1:
+        depth = 0
+        for end in range(pos, len(domain)):
+            if domain[end] == "(":
+                depth += 1
+            elif domain[end] == ")":
+                depth -= 1
+                if depth == 0:
+                    break
+        block = domain[pos:end + 1]
+        blocks[block.split()[1]] = block
+        pos = domain.find("(:action ", end)
+    return blocks
+
+def repeated_shapes(roots):
+    # {structural hash: [(label, fragment)]} for non-trivial fragments whose
+    # shape occurs more than once among the given (label, root) pairs
+    shapes = {}
+    for label, root in roots:
+        for fragment in root.iter_fragments():
+            if fragment is not root and not fragment.is_trivial:
+                shapes.setdefault(fragment.structural_hash, []).append((label, fragment))
+    return {h: found for h, found in shapes.items() if len(found) > 1}
+
+def print_tree(fragment, indent=0):
+    print("  " * indent + str(fragment))
+    for child in fragment.children:
+        print_tree(child, indent + 1)
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Decompose BPMN diagrams into SESE fragments and list fragment shapes that occur more than once.")
+    arg_parser.add_argument("files", nargs="+")
+    args = arg_parser.parse_args(argv)
+
+    roots = []
+    for file_path in args.files:
+        parser = BPMNParser(file_path)
+        parser.parse()
+        root = decompose(parser.build_flow_graph())
+        roots.append((file_path, root))
+        # The printed tree has one line per fragment, the whole process included
+        fragments = list(root.iter_fragments())
+        trivial = sum(1 for f in fragments if f.is_trivial)
+        print(f"{file_path}: {len(fragments)} fragment(s), {trivial} of them single nodes")
+        print_tree(root, 1)
+
+    repeated = repeated_shapes(roots)
+    print(f"\n{len(repeated)} fragment shape(s) occur more than once")
+    for shape, found in sorted(repeated.items(), key=lambda item: -len(item[1])):
+        print(f"  {shape[:12]}: {len(found)} times, {len(found[0][1].nodes)} nodes")
+        for label, fragment in found:
+            print(f"    {label}: {fragment}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import argparse
+import sys
+
+from reachability import ReachabilityIndex
+from read_bpmn_tasks_v2 import BPMNParser, allocate_join_slots
+
+FLOW_NODE_KINDS = ("Event", "Task", "Gateway")
+
+class Finding:
+    def __init__(self, kind, severity, message, element_ids):
+        self.kind = kind
+        self.severity = severity        # "error" or "warning"
+        self.message = message
+        self.element_ids = element_ids
+
+    def __str__(self):
+        return f"{self.severity.upper()} [{self.kind}] {self.message} ({', '.join(self.element_ids)})"
+
+    def as_dict(self):
+        return {
+            "kind": self.kind,
+            "severity": self.severity,
+            "message": self.message,
+            "element_ids": self.element_ids,
+        }
+
+def flow_nodes(graph):
+    return [e.id for e in graph.elements if any(k in e.type for k in FLOW_NODE_KINDS)]
+
+def nearest_common_split(backward_index, sources, splits):
+    # The split gateway that every incoming branch of a join traces back to
+    # and that comes last. Common ancestors are one AND of closure rows;
+    # backward_index numbers nodes in topological order, so the highest one
+    # precedes no other candidate. Loop headers are skipped by the caller,
+    # so the join itself is never an ancestor of its sources.
+    return backward_index.last_reachable_from_all(sources, splits)
+
+def analyze(parser):
+    graph = parser.build_flow_graph()
+    nodes = flow_nodes(graph)
+    node_set = set(nodes)
+    types = {n: graph.elements_by_id[n].type for n in nodes}
+    findings = []
+
+    starts = [n for n in nodes if types[n] == "Start Event"]
+    ends = [n for n in nodes if types[n] == "End Event"]
+    if not starts:
+        findings.append(Finding("no-start", "error", "Process has no start event", []))
+    if not ends:
+        findings.append(Finding("no-end", "error", "Process has no end event", []))
+
+    # Reachability: every node should be reachable from a start and reach an end
+    forward_index = ReachabilityIndex(graph.outgoing, nodes)
+    # Tarjan numbers successors first, so this order puts ancestors first
+    topological = sorted(nodes, key=lambda n: -forward_index.components[n])
+    backward_index = ReachabilityIndex(graph.incoming, topological)
+    forward = forward_index.distances(starts)
+    backward = backward_index.distances(ends)
+    unreachable = sorted(n for n in nodes if n not in forward)
+    if starts and unreachable:
+        findings.append(Finding("unreachable", "warning", "Elements cannot be reached from any start event", unreachable))
+
+    components = forward_index.components
+    members = {}
+    for node, comp in components.items():
+        members.setdefault(comp, []).append(node)
+
+    def in_cycle(node):
+        comp = components.get(node)
+        return len(members.get(comp, [])) > 1 or node in graph.outgoing.get(node, [])
+
+    stuck = [n for n in nodes if n in forward and n not in backward]
+    if ends and stuck:
+        cyclic = sorted(n for n in stuck if in_cycle(n))
+        acyclic = sorted(n for n in stuck if not in_cycle(n))
+        if cyclic:
+            findings.append(Finding("livelock", "error", "Cycle with no path to an end event", cyclic))
+        if acyclic:
+            findings.append(Finding("dead-end", "error", "Elements with no path to an end event", acyclic))
+
+    # Gateway pairing: joins should be closed by a split of the same kind
+    splits = backward_index.mask(
+        n for n in nodes if "Gateway" in types[n] and len(graph.outgoing.get(n, [])) >= 2)
+    for node in nodes:
+        sources = [s for s in graph.incoming.get(node, []) if s in node_set]
+        if "Gateway" not in types[node] or len(sources) < 2:
+            continue
+        # Loop headers merge a back edge with the loop entry; pairing does not apply
+        if any(components.get(s) == components.get(node) for s in sources if in_cycle(node)):
+            continue
+        split = nearest_common_split(backward_index, sources, splits)
+        if split is None:
+            continue
+        split_type = types[split]
+        if "Parallel Gateway" in types[node] and ("Exclusive Gateway" in split_type or "Event-Based Gateway" in split_type):
+            findings.append(Finding(
+                "deadlock", "error",
+                f"Parallel join waits for every branch of {split_type.lower()} {split}, but only one branch runs",
+                [split, node]))
+        elif "Exclusive Gateway" in types[node] and "Parallel Gateway" in split_type:
+            findings.append(Finding(
+                "lack-of-synchronization", "warning",
+                f"Exclusive merge lets every branch of parallel split {split} through separately",
+                [split, node]))
+
+    # Translator limitation: events do not emit actions, so a join slot fed
+    # directly by an event is never set and the parallel join cannot fire
+    _, join_slots = allocate_join_slots(graph)
+    for (src, gw) in sorted(join_slots):
+        if src in types and "Event" in types[src]:
+            findings.append(Finding(
+                "unset-join-slot", "error",
+                f"Parallel join {gw} is fed directly by event {src}, which never sets its join slot",
+                [src, gw]))
+
+    return findings
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Statically check BPMN diagrams for deadlocks and other unsound patterns.")
+    arg_parser.add_argument("files", nargs="+")
+    args = arg_parser.parse_args(argv)
+
+    exit_code = 0
+    for file_path in args.files:
+        parser = BPMNParser(file_path)
+        parser.parse()
+        findings = analyze(parser)
+        print(f"{file_path}: {len(findings)} finding(s)")
+        for finding in findings:
+            print(f"  {finding}")
+        if any(f.severity == "error" for f in findings):
+            exit_code = 1
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import argparse
+import sys
+from collections import deque
+
+from pddl_model import atom_name, effect_outcomes, flatten_and, format_sexpr, is_atom, parse_domain, parse_problem
+from read_bpmn_tasks_v2 import translate
+
+# States are Python ints used as bit vectors: bit i is set when predicate i
+# holds. Preconditions, conditions and effects are compiled to masks once, so
+# successor generation is a handful of integer operations per rule.
+
+class CompiledAction:
+    def __init__(self, name, pos, neg, outcomes):
+        self.name = name
+        self.pos = pos              # bits that must be set
+        self.neg = neg              # bits that must be clear
+        self.outcomes = outcomes    # [[(cond_pos, cond_neg, add, delete), ...], ...]
+
+    def applicable(self, state):
+        return state & self.pos == self.pos and not state & self.neg
+
+    def successors(self, state):
+        # One successor per oneof outcome; `when` conditions see the old state
+        result = []
+        for rules in self.outcomes:
+            adds = deletes = 0
+            for cond_pos, cond_neg, add, delete in rules:
+                if state & cond_pos == cond_pos and not state & cond_neg:
+                    adds |= add
+                    deletes |= delete
+            result.append((state & ~deletes) | adds)
+        return result
+
+class CompiledDomain:
+    def __init__(self, domain):
+        self.name = domain.name
+        self.predicates = list(domain.predicates)
+        self.bits = {}
+        for pred in ["done", "started", *self.predicates]:
+            self.bit(pred)
+        self.actions = [self.compile_action(a) for a in domain.actions]
+
+    def bit(self, pred):
+        if pred not in self.bits:
+            self.bits[pred] = len(self.bits)
+        return self.bits[pred]
+
+    def literals(self, formula):
+        # Conjunction of literals -> (pos mask, neg mask)
+        pos = neg = 0
+        if is_atom(formula):
+            if formula:
+                pos |= 1 << self.bit(atom_name(formula))
+            return pos, neg
+        head = formula[0]
+        if head == "and":
+            for f in formula[1:]:
+                p, n = self.literals(f)
+                pos |= p
+                neg |= n
+        elif head == "not" and is_atom(formula[1]):
+            neg |= 1 << self.bit(atom_name(formula[1]))
+        else:
+            raise ValueError(f"Only conjunctions of literals can be compiled: {format_sexpr(formula)}")
+        return pos, neg
+
+    def effect_rules(self, effect, cond_pos=0, cond_neg=0, rules=None):
+        # Deterministic effect -> [(cond_pos, cond_neg, add, delete)]
+        if rules is None:
+            rules = []
+        if is_atom(effect):
+            if effect:
+                rules.append((cond_pos, cond_neg, 1 << self.bit(atom_name(effect)), 0))
+        elif effect[0] == "not":
+            rules.append((cond_pos, cond_neg, 0, 1 << self.bit(atom_name(effect[1]))))
+        elif effect[0] == "and":
+            for e in effect[1:]:
+                self.effect_rules(e, cond_pos, cond_neg, rules)
+        elif effect[0] == "when":
+            p, n = self.literals(effect[1])
+            self.effect_rules(effect[2], cond_pos | p, cond_neg | n, rules)
+        else:
+            raise ValueError(f"Effect is not deterministic: {format_sexpr(effect)}")
+        return rules
+
+    def compile_action(self, action):
+        pos, neg = self.literals(action.precondition)
+        outcomes = []
+        seen = set()
+        for outcome in effect_outcomes(action.effect):
+            outcome = flatten_and(outcome)
+            key = format_sexpr(outcome)
+            if key not in seen:
+                seen.add(key)
+                outcomes.append(self.effect_rules(outcome))
+        return CompiledAction(action.name, pos, neg, outcomes)
+
+    def encode(self, atoms):
+        state = 0
+        for atom in atoms:
+            state |= 1 << self.bit(atom)
+        return state
+
+    def decode(self, state):
+        return sorted(p for p, i in self.bits.items() if state >> i & 1)
+
+class Exploration:
+    def __init__(self, init, goal_states, successors, truncated):
+        self.init = init
+        self.goal_states = goal_states
+        self.successors = successors    # {state: [successor states]}
+        self.truncated = truncated
+
+    @property
+    def state_count(self):
+        return len(self.successors)
+
+    @property
+    def transition_count(self):
+        return sum(len(s) for s in self.successors.values())
+
+    def stuck_states(self):
+        # Non-goal states where no action is applicable
+        return [s for s, nxt in self.successors.items() if not nxt and s not in self.goal_states]
+
+    def can_reach_goal(self):
+        # Backward breadth-first search from the goal states over reversed edges
+        predecessors = {}
+        for state, nxt in self.successors.items():
+            for s in nxt:
+                predecessors.setdefault(s, []).append(state)
+        reached = set(self.goal_states)
+        queue = deque(reached)
+        while queue:
+            state = queue.popleft()
+            for prev in predecessors.get(state, []):
+                if prev not in reached:
+                    reached.add(prev)
+                    queue.append(prev)
+        return reached
+
+    def dead_ends(self):
+        # States from which (done) can no longer be reached
+        if self.truncated:
+            return []
+        alive = self.can_reach_goal()
+        return [s for s in self.successors if s not in alive]
+
+    @property
+    def goal_reachable(self):
+        return bool(self.goal_states)
+
+def explore(compiled, init, goal, max_states=None):
+    # Breadth-first reachability over every oneof outcome from init (an int)
+    goal_pos, goal_neg = compiled.literals(goal)
+    successors = {}
+    goal_states = set()
+    seen = {init}
+    queue = deque([init])
+    truncated = False
+    while queue:
+        state = queue.popleft()
+        nxt = []
+        if state & goal_pos == goal_pos and not state & goal_neg:
+            # Goal states are absorbing: the policy stops there
+            goal_states.add(state)
+            successors[state] = nxt
+            continue
+        for action in compiled.actions:
+            if action.applicable(state):
+                for succ in action.successors(state):
+                    nxt.append(succ)
+                    if succ not in seen:
+                        seen.add(succ)
+                        queue.append(succ)
+        successors[state] = nxt
+        if max_states is not None and len(seen) >= max_states:
+            truncated = True
+            break
+    for state in queue:
+        successors.setdefault(state, [])
+    return Exploration(init, goal_states, successors, truncated)
+
+def explore_translation(result, max_states=None):
+    # {problem name: Exploration} for a TranslationResult
+    compiled = CompiledDomain(parse_domain(result.domain))
+    explorations = {}
+    for problem_name, text in result.problems.items():
+        problem = parse_problem(text)
+        explorations[problem_name] = explore(compiled, compiled.encode(problem.init), problem.goal, max_states)
+    return compiled, explorations
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Explore the state space of the generated FOND model without a planner.")
+    arg_parser.add_argument("files", nargs="+", help="BPMN diagrams")
+    arg_parser.add_argument("--max-states", type=int, default=None)
+    arg_parser.add_argument("--show-dead-ends", type=int, default=0, metavar="N", help="print the atoms of up to N dead-end states")
+    args = arg_parser.parse_args(argv)
+
+    exit_code = 0
+    for file_path in args.files:
+        result = translate(file_path)
+        compiled, explorations = explore_translation(result, args.max_states)
+        print(f"{file_path}: {len(compiled.bits)} predicates, {len(compiled.actions)} actions")
+        for problem_name, exp in explorations.items():
+            dead_ends = exp.dead_ends()
+            status = "done reachable" if exp.goal_reachable else "done NOT reachable"
+            if exp.truncated:
+                status += f", truncated at {args.max_states} states"
+            print(f"  {problem_name}: {exp.state_count} states, {exp.transition_count} transitions, "
+                  f"{len(exp.goal_states)} goal states, {len(dead_ends)} dead ends "
+                  f"({len(exp.stuck_states())} with no applicable action); {status}")
+            for state in dead_ends[:args.show_dead_ends]:
+                print(f"    dead end: {' '.join(compiled.decode(state))}")
+            if not exp.goal_reachable and not exp.truncated:
+                exit_code = 1
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
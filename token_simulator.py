@@ -0,0 +1,289 @@
+import argparse
+import sys
+import time
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from reachability import ReachabilityIndex
+from read_bpmn_tasks_v2 import BPMNParser
+
+# Token-flow executor of the parsed diagram, independent of the PDDL
+# translation but following its conventions for markings and events. Tokens
+# sit on places fed by the edges of the flow graph (sequence flows plus the
+# synthetic message flows). A batch of instances is one (instances x places)
+# marking array; every step fires one enabled node per instance, picked at
+# random, and random gateway choices are drawn for the whole batch at once.
+
+FLOW_NODE_KINDS = ("Event", "Task", "Gateway")
+
+# Firing rules: which incoming tokens a node needs and consumes, and which
+# outgoing edges it produces on
+JOIN_ANY, JOIN_ALL, JOIN_INCLUSIVE = 0, 1, 2
+SPLIT_ALL, SPLIT_ONE, SPLIT_SOME = 0, 1, 2
+
+class TokenNet:
+    def __init__(self, graph, start_events):
+        if np is None:
+            raise ImportError("The token simulator requires the 'numpy' package")
+        self.nodes = [e.id for e in graph.elements if any(k in e.type for k in FLOW_NODE_KINDS)]
+        self.index = {n: i for i, n in enumerate(self.nodes)}
+        self.types = {e.id: e.type for e in graph.elements}
+        self.names = {e.id: e.name or e.id for e in graph.elements}
+        self.start_events = [s for s in start_events if s in self.index]
+
+        # Tokens sit on places named (source, target) after the predicates of
+        # the PDDL translation. A parallel or inclusive join has one place per
+        # incoming source (its join slots), a node after an event one per
+        # event, and any other node a single place, (None, node), shared by
+        # its other incoming flows and by the initial token of a start event.
+        # A place holds at most one token, as a predicate is either set or not.
+        sources = {n: [] for n in self.nodes}
+        for src in self.nodes:
+            for tgt in graph.outgoing.get(src, []):
+                if tgt in self.index and src not in sources[tgt]:
+                    sources[tgt].append(src)
+
+        def is_join(node):
+            kind = self.types[node]
+            return ("Parallel Gateway" in kind or "Inclusive Gateway" in kind) and len(sources[node]) > 1
+
+        def successors(node):
+            return [t for t in graph.outgoing.get(node, []) if t in self.index]
+
+        def is_event(node):
+            return "Event" in self.types[node] and "Gateway" not in self.types[node]
+
+        def place(src, tgt):
+            # A node right after an event reads the event's predicate, except
+            # a gateway, whose own predicate is set along with the event's
+            if is_join(tgt) or (is_event(src) and "Gateway" not in self.types[tgt]):
+                return (src, tgt)
+            return (None, tgt)
+
+        def passes_through(node):
+            # Intermediate events emit no action in the translation: entering
+            # one marks its successors at once, so it never fires here
+            return is_event(node) and self.types[node] != "End Event" and bool(successors(node))
+
+        def targets(src):
+            # Places src produces on when it fires
+            places = []
+            for tgt in successors(src):
+                if passes_through(tgt):
+                    places += [place(tgt, nxt) for nxt in successors(tgt)]
+                else:
+                    places.append(place(src, tgt))
+            return list(dict.fromkeys(places))
+
+        outgoing_places = {src: targets(src) for src in self.nodes}
+        position = {}
+        for edge in [(None, s) for s in self.start_events] + [e for places in outgoing_places.values() for e in places]:
+            position.setdefault(edge, len(position))
+        edges = self.edges = list(position)
+
+        n, m = len(self.nodes), len(edges)
+        incoming = [[] for _ in range(n)]
+        for e, (src, tgt) in enumerate(edges):
+            incoming[self.index[tgt]].append(e)
+        outgoing = [[position[e] for e in outgoing_places[src]] for src in self.nodes]
+
+        self.join = np.full(n, JOIN_ANY, dtype=np.int8)
+        self.split = np.full(n, SPLIT_ALL, dtype=np.int8)
+        self.is_end = np.zeros(n, dtype=bool)
+        for i, node in enumerate(self.nodes):
+            kind = self.types[node]
+            if "Parallel Gateway" in kind:
+                self.join[i] = JOIN_ALL
+            elif "Inclusive Gateway" in kind:
+                self.join[i] = JOIN_INCLUSIVE if is_join(node) else JOIN_ANY
+                self.split[i] = SPLIT_SOME
+            elif "Exclusive Gateway" in kind or "Event-Based Gateway" in kind:
+                self.split[i] = SPLIT_ONE
+            self.is_end[i] = kind == "End Event"
+
+        self.in_pad = self.pad(incoming)
+        self.out_pad = self.pad(outgoing)
+        self.in_degree = np.array([len(x) for x in incoming], dtype=np.int32)
+        self.incidence = np.zeros((m, n), dtype=np.float32)
+        for i, es in enumerate(incoming):
+            self.incidence[es, i] = 1
+        self.build_inclusive_rule(graph, incoming)
+
+    def pad(self, lists):
+        # Padding points at a scratch column past the last edge, so padded
+        # slots can be read and written along with real ones without effect
+        width = max([len(x) for x in lists] + [1])
+        padded = np.full((len(lists), width), len(self.edges), dtype=np.int64)
+        for i, xs in enumerate(lists):
+            padded[i, :len(xs)] = xs
+        return padded
+
+    def build_inclusive_rule(self, graph, incoming):
+        # An inclusive join may fire once it holds a token and no token
+        # elsewhere can still reach one of its empty incoming edges. For every
+        # incoming edge (u -> join) the upstream edges are those ending in an
+        # ancestor of u, found without walking through the join itself.
+        backward = ReachabilityIndex(graph.incoming, self.nodes)
+        watched = []        # incoming edge of an inclusive join
+        owner = []          # node index of that join
+        upstream = []
+        for i, node in enumerate(self.nodes):
+            if self.join[i] != JOIN_INCLUSIVE:
+                continue
+            for e in incoming[i]:
+                ancestors = backward.distances([self.edges[e][0]], blocked=node)
+                upstream.append([f for f, (_, tgt) in enumerate(self.edges) if tgt in ancestors and f != e])
+                watched.append(e)
+                owner.append(i)
+        self.watched = np.array(watched, dtype=np.int64)
+        self.upstream = np.zeros((len(self.edges), len(watched)), dtype=np.float32)
+        for k, fs in enumerate(upstream):
+            self.upstream[fs, k] = 1
+        self.watch_owner = np.zeros((len(watched), len(self.nodes)), dtype=np.float32)
+        self.watch_owner[np.arange(len(watched)), owner] = 1
+
+    def initial_marking(self, instances, rng, start=None):
+        marking = np.zeros((instances, len(self.edges) + 1), dtype=np.int8)
+        if start is not None:
+            marking[:, self.start_events.index(start)] = 1
+        elif self.start_events:
+            marking[np.arange(instances), rng.integers(len(self.start_events), size=instances)] = 1
+        return marking
+
+    def enabled(self, marking):
+        has = (marking[:, :-1] > 0).astype(np.float32)
+        marked_in = has @ self.incidence
+        enabled = marked_in > 0
+        enabled &= (self.join != JOIN_ALL) | (marked_in >= self.in_degree)
+        if len(self.watched):
+            waiting = (has[:, self.watched] == 0) & ((has @ self.upstream) > 0)
+            enabled &= (waiting.astype(np.float32) @ self.watch_owner) == 0
+        return enabled
+
+class SimulationResult:
+    def __init__(self, net, traces, lengths, end_nodes, marking, steps, seconds):
+        self.net = net
+        self.traces = traces            # (instances, max_steps) node indices, -1 padded
+        self.lengths = lengths
+        self.end_nodes = end_nodes      # first end event fired, -1 if none
+        self.marking = marking[:, :-1]  # final marking
+        self.steps = steps
+        self.seconds = seconds
+
+    @property
+    def instances(self):
+        return len(self.lengths)
+
+    @property
+    def completed(self):
+        # Reached an end event and left no tokens behind
+        return (self.end_nodes >= 0) & (self.marking.sum(axis=1) == 0)
+
+    @property
+    def steps_per_second(self):
+        return self.steps / self.seconds if self.seconds else float("inf")
+
+    def trace(self, i):
+        return [self.net.nodes[n] for n in self.traces[i, :self.lengths[i]]]
+
+    def trace_distribution(self):
+        # Counter of traces (tuples of node ids), counted over identical rows
+        rows, counts = np.unique(self.traces, axis=0, return_counts=True)
+        distribution = Counter()
+        for row, count in zip(rows, counts):
+            distribution[tuple(self.net.nodes[n] for n in row if n >= 0)] += int(count)
+        return distribution
+
+    def end_distribution(self):
+        distribution = Counter()
+        for node, count in zip(*np.unique(self.end_nodes, return_counts=True)):
+            distribution[self.net.nodes[node] if node >= 0 else None] += int(count)
+        return distribution
+
+def simulate(net, instances=10000, max_steps=200, seed=None, start=None):
+    rng = np.random.default_rng(seed)
+    marking = net.initial_marking(instances, rng, start)
+    traces = np.full((instances, max_steps), -1, dtype=np.int32)
+    lengths = np.zeros(instances, dtype=np.int32)
+    end_nodes = np.full(instances, -1, dtype=np.int32)
+    steps = 0
+    began = time.perf_counter()
+
+    # Instances drop out of the batch once nothing is enabled in them
+    live = np.arange(instances)
+    for step in range(max_steps):
+        enabled = net.enabled(marking[live])
+        active = enabled.any(axis=1)
+        rows = live[active]
+        if not len(rows):
+            break
+        live = rows
+        # Interleaving: one uniformly chosen enabled node per instance
+        scores = rng.random((len(rows), len(net.nodes))) * enabled[active]
+        chosen = scores.argmax(axis=1)
+        col = rows[:, None]
+
+        cand = net.in_pad[chosen]
+        valid = cand < len(net.edges)
+        marked = valid & (marking[col, cand] > 0)
+        first = np.zeros_like(marked)
+        first[np.arange(len(rows)), marked.argmax(axis=1)] = True
+        join = net.join[chosen][:, None]
+        consume = np.where(join == JOIN_ALL, valid, np.where(join == JOIN_INCLUSIVE, marked, first))
+        marking[col, cand] -= consume
+
+        cand = net.out_pad[chosen]
+        valid = cand < len(net.edges)
+        draws = rng.random(cand.shape) * valid
+        one = np.zeros_like(valid)
+        one[np.arange(len(rows)), draws.argmax(axis=1)] = True
+        one &= valid
+        some = (draws > 0.5) & valid
+        some |= one & ~some.any(axis=1)[:, None]
+        split = net.split[chosen][:, None]
+        produce = np.where(split == SPLIT_ALL, valid, np.where(split == SPLIT_ONE, one, some))
+        marking[col, cand] |= produce
+
+        traces[rows, step] = chosen
+        lengths[rows] += 1
+        ended = rows[net.is_end[chosen] & (end_nodes[rows] < 0)]
+        end_nodes[ended] = traces[ended, step]
+        steps += len(rows)
+
+    return SimulationResult(net, traces, lengths, end_nodes, marking, steps, time.perf_counter() - began)
+
+def net_from_parser(parser):
+    graph = parser.build_flow_graph()
+    return TokenNet(graph, [e.id for e in parser.get_process_start_events()])
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Simulate BPMN token flow for a batch of process instances.")
+    arg_parser.add_argument("files", nargs="+")
+    arg_parser.add_argument("-n", "--instances", type=int, default=10000)
+    arg_parser.add_argument("--max-steps", type=int, default=200)
+    arg_parser.add_argument("--seed", type=int, default=None)
+    arg_parser.add_argument("--start", default=None, help="start event id (default: a random process start event per instance)")
+    arg_parser.add_argument("--top", type=int, default=5, help="number of most frequent traces to print")
+    args = arg_parser.parse_args(argv)
+
+    for file_path in args.files:
+        parser = BPMNParser(file_path)
+        parser.parse()
+        net = net_from_parser(parser)
+        result = simulate(net, args.instances, args.max_steps, args.seed, args.start)
+        distribution = result.trace_distribution()
+        print(f"{file_path}: {result.instances} instances, {result.steps} steps "
+              f"({result.steps_per_second:,.0f} steps/s), {len(distribution)} distinct traces, "
+              f"{int(result.completed.sum())} completed")
+        for end, count in result.end_distribution().most_common():
+            print(f"  end {net.names[end] if end else '(none)'}: {count}")
+        for trace, count in distribution.most_common(args.top):
+            print(f"  {count:>7}  {' -> '.join(net.names[n] for n in trace)}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
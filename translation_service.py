@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlsplit
+
+from read_bpmn_tasks_v2 import TranslationOptions, translate
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# The ?name= parameter is written into (define (domain ...)) verbatim
+DOMAIN_NAME = re.compile(r"[A-Za-z][A-Za-z0-9_-]*")
+
+# Translated once by every worker at start-up, so imports and the parser's
+# first-use costs are paid before the first request arrives
+WARM_UP_DIAGRAM = b"""<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" id="warm_up">
+  <bpmn:process id="process">
+    <bpmn:startEvent id="start"><bpmn:outgoing>f1</bpmn:outgoing></bpmn:startEvent>
+    <bpmn:task id="task"><bpmn:incoming>f1</bpmn:incoming><bpmn:outgoing>f2</bpmn:outgoing></bpmn:task>
+    <bpmn:endEvent id="end"><bpmn:incoming>f2</bpmn:incoming></bpmn:endEvent>
+    <bpmn:sequenceFlow id="f1" sourceRef="start" targetRef="task" />
+    <bpmn:sequenceFlow id="f2" sourceRef="task" targetRef="end" />
+  </bpmn:process>
+</bpmn:definitions>
+"""
+
+def translate_payload(payload, domain_name):
+    # Runs in a pool worker, which has already paid for imports and regex
+    # compilation on its first job
+    result = translate(payload, TranslationOptions(domain_name))
+    return {
+        "domain_name": result.domain_name,
+        "domain": result.domain,
+        "problems": result.problems,
+        "predicates": result.predicates,
+    }
+
+def warm_up_worker():
+    translate_payload(WARM_UP_DIAGRAM, "warm-up")
+
+class ResultCache:
+    # Small LRU keyed by sha256(domain name + payload)
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+class Metrics:
+    def __init__(self, window=1000):
+        self.requests = 0
+        self.errors = 0
+        self.coalesced = 0          # requests that waited on an identical in-flight job
+        self.queue_depth = 0        # jobs submitted to the pool and not finished
+        self.max_queue_depth = 0
+        self.latencies = deque(maxlen=window)
+
+    def job_started(self):
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def job_finished(self):
+        self.queue_depth -= 1
+
+    def snapshot(self, cache):
+        ordered = sorted(self.latencies)
+
+        def percentile(p):
+            if not ordered:
+                return None
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "coalesced": self.coalesced,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "latency_seconds": {
+                "count": len(ordered),
+                "mean": sum(ordered) / len(ordered) if ordered else None,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": ordered[-1] if ordered else None,
+            },
+            "cache": {
+                "entries": len(cache.entries),
+                "hits": cache.hits,
+                "misses": cache.misses,
+            },
+        }
+
+class TranslationService:
+    def __init__(self, workers=None, cache_size=256):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.cache = ResultCache(cache_size)
+        self.metrics = Metrics()
+        # Identical payloads that arrive while the first is still running wait
+        # on the same future instead of being translated twice
+        self.in_flight = {}
+
+    async def translate(self, payload, domain_name):
+        # (result, cached, coalesced): answered from the cache, or by waiting
+        # on an identical job that was already running
+        key = hashlib.sha256(domain_name.encode() + b"\0" + payload).hexdigest()
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, True, False
+
+        future = self.in_flight.get(key)
+        if future is None:
+            self.metrics.job_started()
+            future = asyncio.ensure_future(self.run_job(payload, domain_name))
+            self.in_flight[key] = future
+            try:
+                result = await future
+            finally:
+                self.metrics.job_finished()
+                del self.in_flight[key]
+            self.cache.put(key, result)
+            return result, False, False
+
+        self.metrics.coalesced += 1
+        return await asyncio.shield(future), False, True
+
+    async def run_job(self, payload, domain_name):
+        # A worker that dies (OOM killer, segfault) breaks the whole pool, so
+        # the pool is replaced and the job gets one more try
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = self.pool
+            try:
+                return await loop.run_in_executor(pool, translate_payload, payload, domain_name)
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                self.replace_pool(pool)
+
+    def replace_pool(self, broken):
+        # Every job running on the broken pool fails at once; only the first
+        # one to get here replaces it
+        if self.pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    async def handle(self, method, path, body):
+        url = urlsplit(path)
+        if method == "GET" and url.path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and url.path == "/metrics":
+            return 200, self.metrics.snapshot(self.cache)
+        if method == "POST" and url.path == "/translate":
+            query = parse_qs(url.query)
+            domain_name = query.get("name", ["bpmn-generated"])[0]
+            if not DOMAIN_NAME.fullmatch(domain_name):
+                return 400, {"error": f"invalid domain name {domain_name!r}: use letters, digits, '-' and '_', starting with a letter"}
+            if not body:
+                return 400, {"error": "empty BPMN payload"}
+            try:
+                result, cached, coalesced = await self.translate(body, domain_name)
+            except BrokenProcessPool:
+                return 503, {"error": "translation workers crashed twice; try again"}
+            except Exception as exc:
+                return 422, {"error": f"{type(exc).__name__}: {exc}"}
+            return 200, dict(result, cached=cached, coalesced=coalesced)
+        return 404, {"error": f"no route for {method} {url.path}"}
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, _version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "malformed request line"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                # Without a valid length the body cannot be skipped, so the
+                # connection is closed after the error
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.respond(writer, 400, {"error": "invalid Content-Length"}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, 413, {"error": "payload too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                started = time.perf_counter()
+                self.metrics.requests += 1
+                status, response = await self.handle(method, path, body)
+                if status >= 400:
+                    self.metrics.errors += 1
+                if path.startswith("/translate"):
+                    self.metrics.latencies.append(time.perf_counter() - started)
+
+                await self.respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 422: "Unprocessable Entity", 503: "Service Unavailable"}
+        body = json.dumps(payload).encode()
+        head = (
+            f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    def warm_up(self):
+        # Start every worker process and have it translate a tiny diagram now
+        # rather than on the first requests
+        futures = [self.pool.submit(warm_up_worker) for _ in range(self.workers)]
+        for f in futures:
+            f.result()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+async def serve(service, host="127.0.0.1", port=8813, unix_socket=None):
+    if unix_socket:
+        server = await asyncio.start_unix_server(service.serve_connection, path=unix_socket)
+        where = unix_socket
+    else:
+        server = await asyncio.start_server(service.serve_connection, host, port)
+        where = f"http://{host}:{server.sockets[0].getsockname()[1]}"
+    print(f"Translation service listening on {where}")
+    sys.stdout.flush()
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Serve BPMN-to-PDDL translations over HTTP.")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8813)
+    arg_parser.add_argument("--unix-socket", default=None, help="listen on this Unix socket instead of TCP")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None)
+    arg_parser.add_argument("--cache-size", type=int, default=256)
+    args = arg_parser.parse_args(argv)
+
+    service = TranslationService(args.workers, args.cache_size)
+    service.warm_up()
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+from batch_translate import BPMN_SUFFIXES
+from read_bpmn_tasks_v2 import translate_file
+
+class DiagramWatcher:
+    # Polls a directory with os.scandir (one stat per diagram per tick), waits
+    # until a file has stopped changing for `debounce` seconds and then
+    # retranslates just that file. Translations are cached by content hash, so
+    # a save that does not change the bytes costs one hash and no parse.
+    def __init__(self, directory, output_dir=None, interval=0.2, debounce=0.3, on_result=None):
+        self.directory = directory
+        self.output_dir = output_dir
+        self.interval = interval
+        self.debounce = debounce
+        self.on_result = on_result or (lambda path, result, cached: None)
+        self.snapshot = {}   # path -> (mtime_ns, size)
+        self.pending = {}    # path -> monotonic time of the last observed change
+        self.cache = {}      # path -> (sha256, result)
+
+    def scan(self):
+        current = {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(BPMN_SUFFIXES):
+                    st = entry.stat()
+                    current[entry.path] = (st.st_mtime_ns, st.st_size)
+        return current
+
+    def poll(self, now=None):
+        now = time.monotonic() if now is None else now
+        current = self.scan()
+
+        for path, sig in current.items():
+            if self.snapshot.get(path) != sig:
+                self.pending[path] = now
+        for path in set(self.snapshot) - set(current):
+            self.pending.pop(path, None)
+            self.cache.pop(path, None)
+        self.snapshot = current
+
+        ready = [p for p, t in self.pending.items() if now - t >= self.debounce]
+        for path in sorted(ready):
+            del self.pending[path]
+            self.translate(path)
+        return ready
+
+    def translate(self, path):
+        try:
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            # Deleted or renamed since the scan; the next poll forgets it
+            self.cache.pop(path, None)
+            return None
+
+        cached = self.cache.get(path)
+        if cached and cached[0] == digest:
+            self.on_result(path, cached[1], True)
+            return cached[1]
+
+        started = time.perf_counter()
+        try:
+            result = translate_file(path, self.output_dir)
+            result["status"] = "ok"
+            self.cache[path] = (digest, result)
+        except Exception as exc:
+            result = {"status": "failed", "error": f"{type(exc).__name__}: {exc}"}
+        result["seconds"] = round(time.perf_counter() - started, 6)
+        self.on_result(path, result, False)
+        return result
+
+    def run(self, initial=True):
+        if not initial:
+            # Only react to edits made after start-up
+            self.snapshot = self.scan()
+        while True:
+            self.poll()
+            # Sleep less while a debounce window is open so changes turn around
+            # promptly; otherwise idle at the base interval
+            if self.pending:
+                time.sleep(min(self.interval, self.debounce / 2))
+            else:
+                time.sleep(self.interval)
+
+def print_result(path, result, cached):
+    if cached:
+        print(f"unchanged {path}")
+    elif result["status"] == "ok":
+        print(f"ok        {path} ({result['actions']} actions, {result['seconds']:.3f}s)")
+    else:
+        print(f"FAILED    {path}: {result['error']}", file=sys.stderr)
+    sys.stdout.flush()
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Retranslate BPMN diagrams whenever they change.")
+    arg_parser.add_argument("directory", nargs="?", default="bpmn_diagrams")
+    arg_parser.add_argument("-o", "--output-dir", default=None)
+    arg_parser.add_argument("--interval", type=float, default=0.2, help="seconds between directory scans")
+    arg_parser.add_argument("--debounce", type=float, default=0.3, help="quiet period before a changed file is retranslated")
+    arg_parser.add_argument("--skip-initial", action="store_true", help="do not translate existing diagrams on start-up")
+    args = arg_parser.parse_args(argv)
+
+    watcher = DiagramWatcher(args.directory, args.output_dir, args.interval, args.debounce, print_result)
+    print(f"Watching {args.directory} for changes (Ctrl+C to stop)")
+    try:
+        watcher.run(initial=not args.skip_initial)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())